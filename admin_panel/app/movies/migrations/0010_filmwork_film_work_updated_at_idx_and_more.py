@@ -0,0 +1,34 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_filmwork_film_work_creation_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(
+                fields=['updated_at', 'id'],
+                name='film_work_updated_at_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(
+                fields=['updated_at', 'id'],
+                name='genre_updated_at_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(
+                fields=['updated_at', 'id'],
+                name='person_updated_at_idx'
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:40
+
+from django.db import migrations
+
+ENTITY_TABLES = ('film_work', 'genre', 'person')
+LINK_TABLES = ('genre_film_work', 'person_film_work')
+
+CREATE_FUNCTION = '''
+CREATE OR REPLACE FUNCTION content.etl_notify() RETURNS trigger AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+    IF TG_TABLE_NAME IN ('genre_film_work', 'person_film_work') THEN
+        PERFORM pg_notify(
+            'etl_changes',
+            json_build_object('table', 'film_work', 'id', changed.film_work_id)::text
+        );
+    ELSE
+        PERFORM pg_notify(
+            'etl_changes',
+            json_build_object('table', TG_TABLE_NAME, 'id', changed.id)::text
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+CREATE_TRIGGER = '''
+CREATE TRIGGER {table}_etl_notify
+AFTER {events} ON content.{table}
+FOR EACH ROW EXECUTE FUNCTION content.etl_notify();
+'''
+
+DROP_TRIGGER = 'DROP TRIGGER IF EXISTS {table}_etl_notify ON content.{table};'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_filmwork_film_work_updated_at_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_FUNCTION,
+            reverse_sql='DROP FUNCTION IF EXISTS content.etl_notify();',
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER.format(table=table, events='INSERT OR UPDATE'),
+            reverse_sql=DROP_TRIGGER.format(table=table),
+        )
+        for table in ENTITY_TABLES
+    ] + [
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER.format(table=table, events='INSERT OR UPDATE OR DELETE'),
+            reverse_sql=DROP_TRIGGER.format(table=table),
+        )
+        for table in LINK_TABLES
+    ]
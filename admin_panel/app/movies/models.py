@@ -29,6 +29,11 @@ class Genre(UUIDMixin, TimeStampedMixin):
 
     class Meta:
         db_table = "content\".\"genre"
+        indexes = [
+            models.Index(
+                fields=['updated_at', 'id'],
+                name='genre_updated_at_idx'),
+        ]
         verbose_name = _('Genre')
         verbose_name_plural = _('Genres')
 
@@ -41,6 +46,11 @@ class Person(UUIDMixin, TimeStampedMixin):
 
     class Meta:
         db_table = "content\".\"person"
+        indexes = [
+            models.Index(
+                fields=['updated_at', 'id'],
+                name='person_updated_at_idx'),
+        ]
         verbose_name = _('Person')
         verbose_name_plural = _('Persons')
 
@@ -75,6 +85,9 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
             models.Index(
                 fields=['creation_date'],
                 name='film_work_creation_date_idx'),
+            models.Index(
+                fields=['updated_at', 'id'],
+                name='film_work_updated_at_idx'),
         ]
         verbose_name = _('Filmwork')
         verbose_name_plural = _('Filmworks')
@@ -29,10 +29,10 @@ class SearchConnector:
             return None, None
         return film.title, ", ".join(film.actors_names)
 
-    def find_top_films(self, genre: str = None, page: int = 1
-                       ) -> List[Optional[FilmBase]]:
-        films = self._find_films(genre=genre, page=page)
-        return films
+    def find_top_films(self, genre: str = None, cursor: str = None
+                       ) -> Tuple[Optional[List[FilmBase]], Optional[str]]:
+        """Страница топа фильмов и курсор следующей страницы."""
+        return self._find_films(genre=genre, cursor=cursor)
 
     def find_person_films(self, query: str
                           ) -> Tuple[Optional[str], Optional[str]]:
@@ -67,32 +67,19 @@ class SearchConnector:
 
         return Film(**response.json())
 
-    def _find_films(self, genre: str = None, page: int = 1, size: int = 3
-                    ) -> List[Optional[FilmBase]]:
+    def _find_films(self, genre: str = None, cursor: str = None, size: int = 3
+                    ) -> Tuple[Optional[List[FilmBase]], Optional[str]]:
+        query = {"page[size]": size}
         if genre:
-            response = self._get_response(
-                "films/",
-                query={
-                    "sort": "imdb_rating",
-                    "filter_name": "genre",
-                    "filter_arg": genre,
-                    "page[number]": page,
-                    "page[size]": size,
-                },
-            )
-        else:
-            response = self._get_response(
-                "films/",
-                query={
-                    "sort": "imdb_rating",
-                    "page[number]": page,
-                    "page[size]": size,
-                },
-            )
+            query["genre"] = genre
+        if cursor:
+            query["page[cursor]"] = cursor
+        response = self._get_response("films/top/", query=query)
 
         if response.status_code != HTTPStatus.OK:
-            return None
-        return [FilmBase(**row) for row in response.json()["values"]]
+            return None, None
+        data = response.json()
+        return [FilmBase(**row) for row in data["values"]], data.get("next_cursor")
 
     def _find_person(self, query: str
                      ) -> Optional[Person]:
@@ -90,19 +90,19 @@ def get_films(form, current_state):
                 "Извините, не понимаю, что вы хотите",
                 current_state,
             )
+        if not current_state.get("cursor"):
+            return "Больше фильмов нет", current_state
         current_state["page"] += 1
     else:
         api_req = {
             "genre": form["slots"].get("genre", {}).get("value"),
         }
-        current_state.update({**api_req, "page": 1})
-    genre = current_state.get("genre")
-    if genre:
-        films = api.find_top_films(
-            genre=genre, page=current_state["page"]
-        )
-    else:
-        films = api.find_top_films(page=current_state["page"])
+        current_state.update({**api_req, "page": 1, "cursor": None})
+    # следующая страница запрашивается по курсору: ее стоимость
+    # не растет с номером страницы
+    films, current_state["cursor"] = api.find_top_films(
+        genre=current_state.get("genre"), cursor=current_state["cursor"]
+    )
 
     if not films:
         return "Я не смогла найти ни одного фильма", current_state
@@ -1,50 +1,415 @@
+import hashlib
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
+from datetime import datetime
+from itertools import chain
+from math import ceil
+from time import sleep
+from typing import Optional
 
-from decorator import backoff
+from decorator import _sleep_time, backoff
 from elasticsearch.exceptions import RequestError
+from elasticsearch.helpers import scan, streaming_bulk
 from index import INDEXES
 from settings import Settings
 
+RETRY_STATUSES = (429, 503)
+HASH_SIZE = 8
+VERSION_SIZE = 16
+
+UPDATE_PERSONS_SCRIPT = """
+for (field in ['actors', 'writers']) {
+    if (ctx._source[field] == null) {
+        continue;
+    }
+    def names = new ArrayList();
+    for (person in ctx._source[field]) {
+        if (params.persons.containsKey(person.id)) {
+            person.name = params.persons[person.id];
+        }
+        names.add(person.name);
+    }
+    ctx._source[field + '_names'] = names;
+}
+"""
+
 
 class ES_LOAD:
     def __init__(self, conn):
         self.cnf = Settings()
         self.conn = conn
+        self.logger = logging.getLogger('es_load::bulk')
+        self.targets = {}
+        self.pool = None
+
+    def index_name(self, index: int) -> str:
+        """
+        Имя индекса для записи: алиас или, во время пересборки,
+        новый версионированный индекс
+        """
+        return self.targets.get(index, self.cnf.elastic_index[index])
+
+    @staticmethod
+    def mapping_version(index: int) -> str:
+        """
+        Версия схемы индекса из index.py: хэш настроек и маппинга.
+        Сохраняется в mappings._meta.version созданного индекса
+        """
+        body = json.dumps(json.loads(INDEXES[index]), sort_keys=True)
+        return hashlib.blake2b(body.encode(), digest_size=VERSION_SIZE // 2).hexdigest()
+
+    def index_body(self, index: int) -> dict:
+        """
+        Тело запроса на создание индекса с версией схемы
+        """
+        body = json.loads(INDEXES[index])
+        body['mappings'].setdefault('_meta', {})['version'] = self.mapping_version(index)
+        return body
+
+    @backoff(logger=logging.getLogger('es_load::live_version'))
+    def live_version(self, index: int) -> Optional[str]:
+        """
+        Версия схемы индекса, на который сейчас указывает алиас.
+        None - у индекса нет версии: он создан до ее появления
+        """
+        mappings = self.conn.indices.get_mapping(index=self.cnf.elastic_index[index])
+        for live in mappings.values():
+            return live['mappings'].get('_meta', {}).get('version')
+        return None
+
+    def iter_ids(self, index: int):
+        """
+        id всех документов индекса, без исходников
+        """
+        for hit in scan(
+                self.conn,
+                index=self.cnf.elastic_index[index],
+                query={'_source': False},
+                size=self.cnf.dump_size,
+        ):
+            yield hit['_id']
+
+    @backoff(logger=logging.getLogger('es_load::top_films'))
+    def top_films(self, index: int, size: int) -> tuple:
+        """
+        Лучшие по рейтингу фильмы: общий список и списки по жанрам
+        одним запросом, жанры - агрегацией terms с top_hits.
+        Из исходников берутся только top_source_fields.
+        Возвращает списки {жанр или None: [(id, рейтинг)]}
+        и исходники попавших в них фильмов {id: документ}
+        """
+        alias = self.cnf.elastic_index[index]
+        sort = [{'imdb_rating': 'desc'}, {'id': 'asc'}]
+        source = self.cnf.top_source_fields
+        response = self.conn.search(index=alias, body={
+            'query': {'exists': {'field': 'imdb_rating'}},
+            'sort': sort,
+            'size': size,
+            '_source': source,
+            'aggs': {'genres': {
+                'terms': {'field': 'genre', 'size': self.cnf.top_max_genres},
+                'aggs': {'top': {'top_hits': {'sort': sort, 'size': size, '_source': source}}},
+            }},
+        })
+        hits = {None: response['hits']['hits']}
+        for bucket in response['aggregations']['genres']['buckets']:
+            hits[bucket['key']] = bucket['top']['hits']['hits']
+        lists = {}
+        docs = {}
+        for genre, genre_hits in hits.items():
+            lists[genre] = [(hit['_id'], hit['_source']['imdb_rating']) for hit in genre_hits]
+            docs.update((hit['_id'], hit['_source']) for hit in genre_hits)
+        return lists, docs
 
     @backoff(logger=logging.getLogger('es_load::create_index'))
-    def create_index(self, index: int):
+    def create_index(self, index: int) -> bool:
         """
-        Создание индекса в es
+        Создание индекса в es: версионированный индекс <имя>_1
+        и алиас <имя>, через который идут чтение и запись.
+        Возвращает False, если индекс уже существует
         """
+        alias = self.cnf.elastic_index[index]
+        if self.conn.indices.exists(alias):
+            return False
+        body = self.index_body(index)
+        body['aliases'] = {alias: {}}
         try:
-            self.conn.indices.create(self.cnf.elastic_index[index], body=INDEXES[index])
+            self.conn.indices.create(f'{alias}_1', body=body)
         except RequestError as e:
             if e.error == 'resource_already_exists_exception':
-                pass
+                return False
+            logging.error(e)
+            raise e
+        logging.info(f'Index {alias}_1 created with mapping version {self.mapping_version(index)}')
+        return True
+
+    @backoff(logger=logging.getLogger('es_load::rebuild_start'))
+    def rebuild_start(self, index: int) -> str:
+        """
+        Создание нового версионированного индекса для пересборки:
+        без обновления поиска и без реплик, чтобы загрузка шла
+        с максимальной скоростью. Запись переключается на него
+        """
+        alias = self.cnf.elastic_index[index]
+        versions = [0]
+        for name, live in self.conn.indices.get(f'{alias}*').items():
+            version = name[len(alias) + 1:]
+            if not name.startswith(f'{alias}_') or not version.isdigit():
+                continue
+            versions.append(int(version))
+            if alias not in live.get('aliases', {}):
+                # остаток прерванной пересборки
+                self.conn.indices.delete(index=name, ignore_unavailable=True)
+        new_index = f'{alias}_{max(versions) + 1}'
+        body = self.index_body(index)
+        body['settings']['refresh_interval'] = '-1'
+        body['settings']['number_of_replicas'] = 0
+        self.conn.indices.create(new_index, body=body)
+        self.targets[index] = new_index
+        logging.info(f'Rebuild {alias} into {new_index}')
+        return new_index
+
+    @backoff(logger=logging.getLogger('es_load::rebuild_finish'))
+    def rebuild_finish(self, index: int):
+        """
+        Завершение пересборки: слияние сегментов, возврат настроек
+        и атомарное переключение алиаса на новый индекс.
+        Старые индексы удаляются
+        """
+        alias = self.cnf.elastic_index[index]
+        new_index = self.targets[index]
+        old_indexes = []
+        replicas = None
+        if self.conn.indices.exists(alias):
+            live = self.conn.indices.get_settings(index=alias)
+            old_indexes = [name for name in live if name != new_index]
+            if old_indexes:
+                replicas = live[old_indexes[0]]['settings']['index'].get('number_of_replicas')
+
+        self.conn.indices.forcemerge(index=new_index, max_num_segments=1)
+        self.conn.indices.put_settings(index=new_index, body={'index': {
+            'refresh_interval': json.loads(INDEXES[index])['settings']['refresh_interval'],
+            'number_of_replicas': replicas,
+        }})
+        self.conn.indices.refresh(index=new_index)
+        self.conn.cluster.health(index=new_index, wait_for_status='yellow')
+
+        actions = [{'add': {'index': new_index, 'alias': alias}}]
+        for old_index in old_indexes:
+            if old_index == alias:
+                # индекс создан до перехода на алиасы
+                actions.append({'remove_index': {'index': old_index}})
             else:
-                logging.error(e)
-                raise e
+                actions.append({'remove': {'index': old_index, 'alias': alias}})
+        self.conn.indices.update_aliases(body={'actions': actions})
+        for old_index in old_indexes:
+            if old_index != alias:
+                self.conn.indices.delete(index=old_index, ignore_unavailable=True)
+        del self.targets[index]
+        logging.info(f'Alias {alias} switched to {new_index}')
 
     @backoff(logger=logging.getLogger('es_load::bulk_update'))
     def bulk_update(self, index:int, docs) -> bool:
         """
-        Запись данных в es
+        Запись данных в es.
+        None означает, что пачка не записана и состояние двигать нельзя
         """
         if not docs:
             logging.warning('No more data to update in elastic')
-            return None
-        body = []
+            return True
+        actions = {
+            str(doc.id): {
+                '_op_type': 'index',
+                '_index': self.index_name(index),
+                '_id': str(doc.id),
+                '_source': asdict(doc),
+            }
+            for doc in docs
+        }
+        return self._bulk(actions, self._refresh(index))
+
+    @staticmethod
+    def diff(docs: list, old_hashes: dict) -> tuple:
+        """
+        Сравнение пачки с хэшами уже записанных документов.
+        Хэш документа - по HASH_SIZE hex-символов на каждое поле.
+        Возвращает документы для полной записи, изменившиеся поля
+        остальных {id: {поле: значение}} и новые хэши {id: хэш}.
+        Неизмененные документы не попадают никуда
+        """
+        new_docs = []
+        changed = {}
+        hashes = {}
         for doc in docs:
-            es_index = {"index": {"_index" : self.cnf.elastic_index[index], "_id" : doc.id}}
-            body.append(json.dumps(es_index))
-            body.append(json.dumps(asdict(doc)))
-        results = self.conn.bulk(body)
-        if results['errors']:
-            error = [result['index'] for result in results['items'] if result['index']['status'] != 200]
-            logging.error(results['took'])
-            logging.error(results['errors'])
-            logging.error(error)
-            return None
-        return True
\ No newline at end of file
+            source = asdict(doc)
+            digests = [
+                hashlib.blake2b(
+                    json.dumps(value, sort_keys=True, default=str).encode(),
+                    digest_size=HASH_SIZE // 2,
+                ).hexdigest()
+                for value in source.values()
+            ]
+            doc_hash = ''.join(digests)
+            old_hash = old_hashes.get(str(doc.id))
+            if old_hash == doc_hash:
+                continue
+            hashes[str(doc.id)] = doc_hash
+            if old_hash is None or len(old_hash) != len(doc_hash):
+                new_docs.append(doc)
+                continue
+            changed[str(doc.id)] = {
+                field: value
+                for position, (field, value) in enumerate(source.items())
+                if old_hash[position * HASH_SIZE:(position + 1) * HASH_SIZE] != digests[position]
+            }
+        return new_docs, changed, hashes
+
+    @backoff(logger=logging.getLogger('es_load::bulk_partial'))
+    def bulk_partial(self, index: int, changed: dict, docs: dict) -> bool:
+        """
+        Частичное обновление документов: отправляются только изменившиеся поля.
+        changed - {id документа: {поле: значение}}, docs - {id: документ}
+        целиком: документ, которого нет в es (удален вручную, индекс
+        собран с ошибкой), записывается заново, а не уходит в dead letter
+        с хэшем, из-за которого его больше никогда не отправят
+        """
+        missing = {
+            doc_id: {
+                '_op_type': 'index',
+                '_index': self.index_name(index),
+                '_id': doc_id,
+                '_source': asdict(docs[doc_id]),
+            }
+            for doc_id in changed
+        }
+        actions = {
+            doc_id: {
+                '_op_type': 'update',
+                '_index': self.index_name(index),
+                '_id': doc_id,
+                'doc': fields,
+            }
+            for doc_id, fields in changed.items()
+        }
+        return self._bulk(actions, self._refresh(index), missing)
+
+    @backoff(logger=logging.getLogger('es_load::update_persons'))
+    def update_persons(self, index: int, persons: dict) -> bool:
+        """
+        Частичное обновление имен актеров и сценаристов в документах фильмов.
+        persons - {id фильма: {id персоны: новое имя}}
+        """
+        actions = {
+            str(film_id): {
+                '_op_type': 'update',
+                '_index': self.index_name(index),
+                '_id': str(film_id),
+                'script': {
+                    'source': UPDATE_PERSONS_SCRIPT,
+                    'lang': 'painless',
+                    'params': {'persons': film_persons},
+                },
+            }
+            for film_id, film_persons in persons.items()
+        }
+        return self._bulk(actions, self._refresh(index))
+
+    def _refresh(self, index: int) -> str:
+        """
+        Режим refresh записи: запись в индекс, который видит поиск,
+        ждет обновления индекса. Иначе сброс кеша после записи
+        успевает раньше refresh_interval, и поиск кеширует
+        старые страницы уже под новым поколением.
+        Пересобираемый индекс поиску не виден, его запись не ждет
+        """
+        return 'false' if index in self.targets else 'wait_for'
+
+    def _bulk(self, actions: dict, refresh: str = 'false', missing: Optional[dict] = None) -> bool:
+        """
+        Параллельная запись пачки действий в es.
+        Документы, отклоненные с 429/503, отправляются повторно,
+        остальные ошибки пишутся в dead letter файл.
+        missing - {id: действие} на случай, если обновляемого
+        документа нет в индексе, оно отправляется следующим заходом
+        """
+        missing = dict(missing or {})
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.cnf.bulk_thread_count, thread_name_prefix='es_bulk')
+        attempt = 0
+        success = True
+        while actions:
+            retry = {}
+            resend = {}
+            failed = []
+            chunks = self._chunks(list(actions.values()))
+            results = self.pool.map(self._send, chunks, [refresh] * len(chunks))
+            for ok, result in chain.from_iterable(results):
+                if ok:
+                    continue
+                op_type, item = result.popitem()
+                action = actions[item['_id']]
+                if 'script' in action and item.get('status') == 404:
+                    # документа фильма еще нет в индексе, он будет записан целиком
+                    continue
+                if item.get('status') == 404 and item['_id'] in missing:
+                    resend[item['_id']] = missing.pop(item['_id'])
+                    continue
+                if item.get('status') in RETRY_STATUSES and attempt < self.cnf.bulk_max_retries:
+                    retry[item['_id']] = action
+                else:
+                    failed.append((item, action))
+            if failed:
+                success = False
+                self._dead_letter(failed)
+            if retry:
+                sleep_time = _sleep_time(0.1, 30, 2, attempt, self.logger)
+                self.logger.warning(
+                    f'{len(retry)} document(s) rejected, retry in {sleep_time} seconds'
+                )
+                sleep(sleep_time)
+                attempt += 1
+            if resend:
+                self.logger.warning(f'{len(resend)} document(s) missing in es, index them in full')
+            actions = {**retry, **resend}
+        return success
+
+    def _chunks(self, actions: list) -> list:
+        """
+        Деление пачки на запросы: поровну между bulk_thread_count
+        потоками, но не больше bulk_chunk_size документов в запросе,
+        поэтому и пачка меньше bulk_chunk_size пишется параллельно
+        """
+        size = min(self.cnf.bulk_chunk_size, max(1, ceil(len(actions) / self.cnf.bulk_thread_count)))
+        return [actions[start:start + size] for start in range(0, len(actions), size)]
+
+    def _send(self, chunk: list, refresh: str = 'false') -> list:
+        """
+        Запись одной части пачки одним запросом bulk,
+        если она не больше bulk_max_chunk_bytes
+        """
+        return list(streaming_bulk(
+            self.conn,
+            chunk,
+            chunk_size=len(chunk),
+            max_chunk_bytes=self.cnf.bulk_max_chunk_bytes,
+            raise_on_error=False,
+            refresh=refresh,
+        ))
+
+    def _dead_letter(self, failed: list):
+        """
+        Сохранение документов, которые не удалось записать в es
+        """
+        self.logger.error(f'{len(failed)} document(s) failed, see {self.cnf.bulk_dead_letter}')
+        with open(self.cnf.bulk_dead_letter, 'a') as dead_letter:
+            for item, action in failed:
+                dead_letter.write(json.dumps({
+                    'time': datetime.now().isoformat(),
+                    'index': action['_index'],
+                    'id': item['_id'],
+                    'status': item.get('status'),
+                    'error': item.get('error'),
+                    'action': action,
+                }, default=str) + '\n')
@@ -1,33 +1,305 @@
+import hashlib
+import json
+import uuid
 from datetime import datetime
+from typing import Optional
 
 from decorator import backoff
 from redis import Redis
 from settings import Settings
 
+NIL_ID = str(uuid.UUID(int=0))
+
+# KEYS: наборы тегов. Удаляет записи кеша из наборов и сами наборы,
+# возвращает удаленные записи
+PURGE_TAGS_SCRIPT = """
+local purged = {}
+for i = 1, #KEYS do
+    for _, key in ipairs(redis.call('smembers', KEYS[i])) do
+        if redis.call('del', key) == 1 then
+            purged[#purged + 1] = key
+        end
+    end
+    redis.call('del', KEYS[i])
+end
+return purged
+"""
+
+# KEYS[1]: очередь фильмов. ARGV: пары id, метка. Снимает из очереди id,
+# метки которых не изменились, то есть фильмы не ставились в очередь заново
+FAN_OUT_DONE_SCRIPT = """
+local done = 0
+for i = 1, #ARGV, 2 do
+    if tonumber(redis.call('zscore', KEYS[1], ARGV[i])) == tonumber(ARGV[i + 1]) then
+        done = done + redis.call('zrem', KEYS[1], ARGV[i])
+    end
+end
+return done
+"""
+
 
 class ETLRedis:
     def __init__(self):
         cnf = Settings()
+        self.partitions = cnf.etl_partitions
+        self.channel = cnf.cache_invalidate_channel
+        self.tag_prefix = cnf.cache_tag_prefix
+        self.generation_prefix = cnf.cache_generation_prefix
+        self.bloom_prefix = cnf.bloom_key_prefix
+        self.bloom_bits = cnf.bloom_bits // 8 * 8
+        self.bloom_hashes = cnf.bloom_hashes
+        self.top_prefix = cnf.top_key_prefix
         self.redis = Redis(
             host=cnf.broker_host,
             port=cnf.broker_port,
             decode_responses=True,
         )
 
+    def state_key(self, index: str, partition: int = 0, rebuild: bool = False) -> str:
+        """
+        Ключ состояния индекса. При разбиении на партиции
+        у каждой партиции свое состояние, у пересборки - свое
+        """
+        key = index
+        if self.partitions != 1:
+            key = f'{index}_{partition}_of_{self.partitions}'
+        if rebuild:
+            key = f'{key}_rebuild'
+        return key
+
+    def fan_out_key(self, index: str, partition: int = 0) -> str:
+        return f':fanout_{self.state_key(index, partition)}'
+
+    @backoff()
+    def fan_out_add(self, index: str, films: dict):
+        """
+        Постановка документов в очереди перевыгрузки партиций индекса:
+        films - {партиция: [id]}. Метка в score растет с каждой
+        постановкой, повторно поставленный документ получает новую
+        """
+        films = {partition: ids for partition, ids in films.items() if ids}
+        if not films:
+            return
+        mark = self.redis.incr(':fanout_seq')
+        with self.redis.pipeline(transaction=True) as pipe:
+            for partition, ids in films.items():
+                pipe.zadd(self.fan_out_key(index, partition), dict.fromkeys(ids, mark))
+            pipe.execute()
+
+    @backoff()
+    def fan_out_take(self, index: str, partition: int, count: int) -> dict:
+        """
+        Первые count документов очереди партиции {id: метка}
+        """
+        return dict(self.redis.zrange(self.fan_out_key(index, partition), 0, count - 1, withscores=True))
+
+    @backoff()
+    def fan_out_done(self, index: str, partition: int, queued: dict):
+        """
+        Снятие перевыгруженных документов queued {id: метка} из очереди.
+        Документы, поставленные заново после чтения очереди, остаются
+        """
+        args = [value for item in queued.items() for value in item]
+        self.redis.eval(FAN_OUT_DONE_SCRIPT, 1, self.fan_out_key(index, partition), *args)
+
+    @backoff()
+    def get_state(self, key: str) -> tuple:
+        """
+        Получение high-water mark индекса: ключа (updated_at, id)
+        последней записанной в es строки из PostgreSQL
+        """
+        state = self.redis.hgetall(f':state_{key}')
+        if state:
+            return datetime.fromisoformat(state['updated_at']), state['id']
+        lasttime = self.redis.get(f':lasttime_{key}')
+        if lasttime is not None:
+            return datetime.fromisoformat(lasttime), NIL_ID
+        return datetime(1970, 1, 1), NIL_ID
+
+    @backoff()
+    def get_hashes(self, index: str, ids: list) -> dict:
+        """
+        Получение сохраненных хэшей документов индекса
+        """
+        if not ids:
+            return {}
+        return dict(zip(ids, self.redis.hmget(f':hashes_{index}', ids)))
+
+    @backoff()
+    def commit(
+            self,
+            key: Optional[str] = None,
+            state: Optional[tuple] = None,
+            hashes: Optional[dict] = None,
+    ):
+        """
+        Сохранение после записи пачки в es: high-water mark (updated_at, id)
+        и хэши записанных документов {индекс: {id: хэш}}.
+        Все пишется одной транзакцией
+        """
+        hashes = {index: docs for index, docs in (hashes or {}).items() if docs}
+        if state is None and not hashes:
+            return
+        with self.redis.pipeline(transaction=True) as pipe:
+            if state is not None:
+                pipe.hset(f':state_{key}', mapping={
+                    'updated_at': state[0].isoformat(),
+                    'id': str(state[1]),
+                })
+            for index, docs in hashes.items():
+                pipe.hset(f':hashes_{index}', mapping=docs)
+            pipe.execute()
+
+    @backoff()
+    def reset(self, keys: list):
+        """
+        Сброс состояний перед пересборкой индекса
+        """
+        self.redis.delete(*[f':state_{key}' for key in keys])
+
+    @backoff()
+    def finish_rebuild(self, keys: dict, index: str, new_index: str):
+        """
+        После переключения алиаса состояния пересборки
+        {ключ пересборки: основной ключ} и хэши нового индекса
+        и фильтр Блума нового индекса становятся основными
+        """
+        states = {key: self.redis.hgetall(f':state_{key}') for key in keys}
+        has_hashes = self.redis.exists(f':hashes_{new_index}')
+        has_bloom = self.redis.exists(self.bloom_key(new_index))
+        with self.redis.pipeline(transaction=True) as pipe:
+            for rebuild_key, key in keys.items():
+                if states[rebuild_key]:
+                    pipe.hset(f':state_{key}', mapping=states[rebuild_key])
+                pipe.delete(f':state_{rebuild_key}')
+            if has_hashes:
+                pipe.rename(f':hashes_{new_index}', f':hashes_{index}')
+            else:
+                pipe.delete(f':hashes_{index}')
+            if has_bloom:
+                pipe.rename(self.bloom_key(new_index), self.bloom_key(index))
+            else:
+                pipe.delete(self.bloom_key(index))
+            pipe.execute()
+
+    def bloom_key(self, index: str) -> str:
+        return f'{self.bloom_prefix}::{index}'
+
+    def bloom_positions(self, doc_id: str) -> list:
+        """
+        Номера битов документа в фильтре Блума: двойное хэширование
+        blake2b. Должно совпадать с src/db/bloom.py в search_service
+        """
+        digest = hashlib.blake2b(doc_id.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        step = int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * step) % self.bloom_bits for i in range(self.bloom_hashes)]
+
+    @backoff()
+    def bloom_exists(self, index: str) -> bool:
+        return bool(self.redis.exists(self.bloom_key(index)))
+
+    @backoff()
+    def bloom_drop(self, index: str):
+        self.redis.delete(self.bloom_key(index))
+
+    @backoff()
+    def bloom_replace(self, source: str, index: str):
+        """
+        Атомарная замена фильтра Блума индекса index фильтром,
+        собранным под именем source. Поиск не видит фильтр
+        наполовину заполненным
+        """
+        if self.redis.exists(self.bloom_key(source)):
+            self.redis.rename(self.bloom_key(source), self.bloom_key(index))
+
+    @backoff()
+    def bloom_add(self, index: str, ids: list):
+        """
+        Добавление id записанных документов в фильтр Блума индекса -
+        битовую карту в Redis, по которой поиск отклоняет
+        запросы заведомо несуществующих документов
+        """
+        if not ids:
+            return
+        with self.redis.pipeline(transaction=False) as pipe:
+            for doc_id in ids:
+                for position in self.bloom_positions(str(doc_id)):
+                    pipe.setbit(self.bloom_key(index), position, 1)
+            pipe.execute()
+
+    def top_key(self, index: str, *parts: str) -> str:
+        """
+        Ключи списков лучших документов, общие с search_service:
+        <префикс>::<индекс>::all, <префикс>::<индекс>::genre::<жанр>,
+        исходники - <префикс>::<индекс>::docs
+        """
+        return '::'.join([self.top_prefix, index, *parts])
+
+    @backoff()
+    def top_mark(self, index: str):
+        """
+        Пометка списков лучших документов индекса к пересчету
+        """
+        self.redis.set(self.top_key(index, 'pending'), 1)
+
+    @backoff()
+    def top_take(self, index: str) -> bool:
+        """
+        Снятие пометки к пересчету. True - пометка была,
+        и пересчитывать списки должен тот, кто ее снял
+        """
+        return bool(self.redis.delete(self.top_key(index, 'pending')))
+
     @backoff()
-    def set_lasttime(self, key: str, lasttime: datetime):
+    def store_top(self, index: str, lists: dict, docs: dict):
         """
-        Сохранение последнего datetime получения данных из PostgreSQL
+        Замена списков лучших документов индекса. lists - {жанр или None:
+        [(id, рейтинг)]}, каждый список - ZSET с рейтингом в score,
+        жанры без учета регистра. docs - исходники {id: документ}.
+        Списки жанров, которых больше нет, удаляются. Все меняется
+        одной транзакцией: поиск не видит списков наполовину
         """
-        key = f':lasttime_{key}'
-        self.redis.set(key, lasttime.isoformat())
+        scores = {}
+        for genre, items in lists.items():
+            key = self.top_key(index, 'genre', genre.lower()) if genre else self.top_key(index, 'all')
+            scores.setdefault(key, {}).update(items)
+        keys_key = self.top_key(index, 'keys')
+        stale = self.redis.smembers(keys_key) - set(scores)
+        with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(keys_key, self.top_key(index, 'docs'), *stale, *scores)
+            for key, items in scores.items():
+                if items:
+                    pipe.zadd(key, items)
+            if scores:
+                pipe.sadd(keys_key, *scores)
+            if docs:
+                pipe.hset(self.top_key(index, 'docs'), mapping={
+                    doc_id: json.dumps(doc) for doc_id, doc in docs.items()
+                })
+            pipe.execute()
 
     @backoff()
-    def get_lasttime(self, key: str) -> datetime:
+    def invalidate(self, index: str, ids: Optional[list] = None, lists_changed: bool = False):
         """
-        Получение последнего datetime получения данных из PostgreSQL
+        Сброс кеша поиска после записи в es. Удаляются записи,
+        помеченные тегами документов ids <префикс>::<индекс>::<id>.
+        Если запись меняет состав или содержимое страниц (lists_changed)
+        и без ids, увеличивается поколение списков индекса
+        <префикс поколений>::<индекс>: оно входит в ключи списков,
+        и старые страницы больше не читаются, а истекают сами.
+        Воркеры поиска получают удаленные ключи для очистки
+        своих локальных кешей и новое поколение, без ids
+        локальные кеши очищаются целиком
         """
-        key = f':lasttime_{key}'
-        if self.redis.get(key) is None:
-            return datetime(1970, 1, 1)
-        return datetime.fromisoformat(self.redis.get(key))
+        tags = [f'{self.tag_prefix}::{index}::{doc_id}' for doc_id in ids or []]
+        purged = self.redis.eval(PURGE_TAGS_SCRIPT, len(tags), *tags)
+        generation = None
+        if lists_changed or not ids:
+            generation = self.redis.incr(f'{self.generation_prefix}::{index}')
+        self.redis.publish(self.channel, json.dumps({
+            'index': index,
+            'ids': ids,
+            'keys': purged if ids else None,
+            'generation': generation,
+        }))
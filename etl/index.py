@@ -17,6 +17,11 @@ INDEXES = ['''
             "e_char_filter": {
                 "type": "mapping",
                 "mappings": ["Ё => Е", "ё => е", "Э => Е", "э => е"]
+            },
+            "space_char_filter": {
+                "type": "pattern_replace",
+                "pattern": "\\\\s+",
+                "replacement": " "
             }
         },
         "analyzer": {
@@ -29,6 +34,13 @@ INDEXES = ['''
                 ],
                 "char_filter": ["e_char_filter"]      
             }
+        },
+        "normalizer": {
+            "raw": {
+                "type": "custom",
+                "char_filter": ["e_char_filter", "space_char_filter"],
+                "filter": ["lowercase", "trim"]
+            }
         }
     }
   },
@@ -48,7 +60,8 @@ INDEXES = ['''
         "analyzer": "ru",
         "fields": {
           "raw": { 
-            "type":  "keyword"
+            "type":  "keyword",
+            "normalizer": "raw"
           }
         }
       },
@@ -116,6 +129,11 @@ INDEXES = ['''
             "e_char_filter": {
                 "type": "mapping",
                 "mappings": ["Ё => Е", "ё => е", "Э => Е", "э => е"]
+            },
+            "space_char_filter": {
+                "type": "pattern_replace",
+                "pattern": "\\\\s+",
+                "replacement": " "
             }
         },
         "analyzer": {
@@ -128,6 +146,13 @@ INDEXES = ['''
                 ],
                 "char_filter": ["e_char_filter"]      
             }
+        },
+        "normalizer": {
+            "raw": {
+                "type": "custom",
+                "char_filter": ["e_char_filter", "space_char_filter"],
+                "filter": ["lowercase", "trim"]
+            }
         }
     }
   },
@@ -141,7 +166,8 @@ INDEXES = ['''
         "analyzer": "ru",
         "fields": {
           "raw": { 
-            "type":  "keyword"
+            "type":  "keyword",
+            "normalizer": "raw"
           }
         }
       },
@@ -171,6 +197,11 @@ INDEXES = ['''
             "e_char_filter": {
                 "type": "mapping",
                 "mappings": ["Ё => Е", "ё => е", "Э => Е", "э => е"]
+            },
+            "space_char_filter": {
+                "type": "pattern_replace",
+                "pattern": "\\\\s+",
+                "replacement": " "
             }
         },
         "analyzer": {
@@ -183,6 +214,13 @@ INDEXES = ['''
                 ],
                 "char_filter": ["e_char_filter"]      
             }
+        },
+        "normalizer": {
+            "raw": {
+                "type": "custom",
+                "char_filter": ["e_char_filter", "space_char_filter"],
+                "filter": ["lowercase", "trim"]
+            }
         }
     }
   },
@@ -196,7 +234,8 @@ INDEXES = ['''
         "analyzer": "ru",
         "fields": {
           "raw": { 
-            "type":  "keyword"
+            "type":  "keyword",
+            "normalizer": "raw"
           }
         }
       }
@@ -0,0 +1,64 @@
+import json
+import logging
+import select
+from collections import defaultdict
+from time import monotonic
+
+from psycopg2.extensions import connection as _connection
+from settings import Settings
+
+CHANNEL = 'etl_changes'
+TABLES = {'film_work': 0, 'genre': 1, 'person': 2}
+
+logger = logging.getLogger('listener')
+
+
+class PGListener:
+    """
+    Получение изменений из PostgreSQL через LISTEN/NOTIFY.
+    Уведомления публикуют триггеры content.etl_notify()
+    """
+
+    def __init__(self, conn: _connection):
+        self.cnf = Settings()
+        self.conn = conn
+        self.conn.autocommit = True
+
+    def listen(self):
+        """
+        Генератор изменений вида {номер индекса: множество id}.
+        Уведомления копятся notify_debounce секунд или до dump_size id.
+        Раз в notify_resync секунд, даже при непрерывных изменениях,
+        отдается None: пора сверить состояние обычной выгрузкой
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(f'LISTEN {CHANNEL};')
+        changes = defaultdict(set)
+        first_change = None
+        last_resync = monotonic()
+        while True:
+            deadline = last_resync + self.cnf.notify_resync
+            if changes:
+                deadline = min(deadline, first_change + self.cnf.notify_debounce)
+            timeout = max(0.0, deadline - monotonic())
+            if select.select([self.conn], [], [], timeout) != ([], [], []):
+                self.conn.poll()
+                while self.conn.notifies:
+                    notify = self.conn.notifies.pop(0)
+                    try:
+                        payload = json.loads(notify.payload)
+                        changes[TABLES[payload['table']]].add(payload['id'])
+                    except (ValueError, KeyError):
+                        logger.warning(f'Unexpected notification {notify.payload}')
+                        continue
+                    if first_change is None:
+                        first_change = monotonic()
+            if changes:
+                if (monotonic() - first_change >= self.cnf.notify_debounce
+                        or sum(len(ids) for ids in changes.values()) >= self.cnf.dump_size):
+                    yield dict(changes)
+                    changes = defaultdict(set)
+                    first_change = None
+            if monotonic() - last_resync >= self.cnf.notify_resync:
+                yield None
+                last_resync = monotonic()
@@ -1,6 +1,7 @@
+import argparse
 import logging
 from contextlib import contextmanager
-from datetime import datetime
+from multiprocessing import Process
 from time import sleep
 
 import psycopg2
@@ -9,7 +10,9 @@ from elasticsearch import Elasticsearch
 from es_load import ES_LOAD
 from etl_redis import ETLRedis
 from index import INDEXES as index_body
+from listener import PGListener
 from pg_dump import PG_DUMP
+from pipeline import GENRES, MOVIES, PERSONS, ETLPipeline
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import DictCursor
 from settings import Settings
@@ -45,33 +48,225 @@ def conn_context_postgres(dsl: dict):
     yield conn
 
 
-def postgres_to_es(es_conn: Elasticsearch, pg_conn: _connection):
+def get_dsl(settings: Settings) -> dict:
     """
-    Основной скрипт по выгрузке данных в es
+    Параметры подключения к postgres
     """
-    redis = ETLRedis()
-    pg_dump = PG_DUMP(pg_conn)
-    es_load = ES_LOAD(es_conn)
-    for item in range(len(settings.elastic_index)):
-        lasttime = redis.get_lasttime(settings.elastic_index[item])
-        for ids in pg_dump.get_updated_id(item, lasttime):
-            entity = pg_dump.get_by_id(item, ids)
-            es_load.create_index(item)
-            es_load.bulk_update(item, entity)
-            redis.set_lasttime(settings.elastic_index[item], datetime.now())
-
-
-if __name__ == '__main__':
-    settings = Settings()
-    dsl = {
+    return {
         'dbname': settings.postgres_name,
         'user': settings.postgres_user,
         'password': settings.postgres_password,
         'host': settings.postgres_host,
         'port': settings.postgres_port
     }
-    with conn_context_es(settings.elastic_host, settings.elastic_port) as es_conn, \
-            conn_context_postgres(dsl) as pg_conn:
+
+
+def bootstrap_indexes(es_conn: Elasticsearch, pg_conn: _connection):
+    """
+    Подготовка индексов при старте: недостающие индексы создаются,
+    индексы со схемой, отличной от index.py, пересобираются без простоя.
+    Для индексов без фильтра Блума он заполняется id из es,
+    списки лучших фильмов пересчитываются.
+    Дальше выгрузка только пишет документы
+    """
+    es_load = ES_LOAD(es_conn)
+    redis = ETLRedis()
+    for item, name in enumerate(settings.elastic_index):
+        if es_load.create_index(item):
+            continue
+        live_version = es_load.live_version(item)
+        if live_version == es_load.mapping_version(item):
+            if not redis.bloom_exists(name):
+                seed_bloom(es_load, redis, item)
+            continue
+        logging.warning(
+            f'Index {name} mapping version {live_version} differs from '
+            f'{es_load.mapping_version(item)}, rebuild'
+        )
+        rebuild_index(es_conn, pg_conn, item)
+    refresh_top(es_load, redis)
+
+
+def seed_bloom(es_load: ES_LOAD, redis: ETLRedis, item: int):
+    """
+    Заполнение фильтра Блума индекса id уже загруженных документов.
+    Фильтр собирается под временным именем и переименовывается
+    в рабочий только целиком: поиск не загрузит недостроенный фильтр,
+    а прерванное заполнение начнется заново при следующем старте
+    """
+    name = settings.elastic_index[item]
+    seed = f'{name}_seed'
+    redis.bloom_drop(seed)
+    ids = []
+    for doc_id in es_load.iter_ids(item):
+        ids.append(doc_id)
+        if len(ids) >= settings.dump_size:
+            redis.bloom_add(seed, ids)
+            ids = []
+    redis.bloom_add(seed, ids)
+    redis.bloom_replace(seed, name)
+    logging.info(f'Bloom filter of {name} seeded')
+
+
+def refresh_top(es_load: ES_LOAD, redis: ETLRedis):
+    """
+    Пересчет списков лучших по рейтингу фильмов, общего и по жанрам,
+    которые поиск отдает из Redis без запросов к es
+    """
+    name = settings.elastic_index[MOVIES]
+    lists, docs = es_load.top_films(MOVIES, settings.top_size)
+    redis.store_top(name, lists, docs)
+    logging.info(f'{name}: top lists refreshed, {len(lists) - 1} genre(s)')
+
+
+def top_refresher():
+    """
+    Пересчет списков лучших фильмов, помеченных выгрузкой,
+    не чаще раза в top_refresh_interval секунд: частые записи
+    фильмов не превращаются в частые агрегации в es
+    """
+    with conn_context_es(settings.elastic_host, settings.elastic_port) as es_conn:
+        es_load = ES_LOAD(es_conn)
+        redis = ETLRedis()
         while True:
+            sleep(settings.top_refresh_interval)
+            try:
+                if redis.top_take(settings.elastic_index[MOVIES]):
+                    refresh_top(es_load, redis)
+            except Exception as e:
+                logging.exception(e)
+                redis.top_mark(settings.elastic_index[MOVIES])
+
+
+def postgres_to_es(es_conn: Elasticsearch, pg_conn: _connection):
+    """
+    Основной скрипт по выгрузке данных в es. Фильмы выгружаются
+    последними: за тот же проход перевыгружаются и фильмы,
+    поставленные в очередь выгрузками жанров и персон
+    """
+    pipeline = ETLPipeline(PG_DUMP(pg_conn), ES_LOAD(es_conn), ETLRedis())
+    for item in (GENRES, PERSONS, MOVIES):
+        for partition in range(settings.etl_partitions):
+            pipeline.run(item, partition)
+
+
+def rebuild_index(es_conn: Elasticsearch, pg_conn: _connection, item: int):
+    """
+    Пересборка индекса без простоя: данные грузятся в новый
+    версионированный индекс, после чего на него атомарно
+    переключается алиас, с которым работает поиск
+    """
+    redis = ETLRedis()
+    es_load = ES_LOAD(es_conn)
+    pipeline = ETLPipeline(PG_DUMP(pg_conn), es_load, redis)
+    name = settings.elastic_index[item]
+    keys = {
+        redis.state_key(name, partition, rebuild=True): redis.state_key(name, partition)
+        for partition in range(settings.etl_partitions)
+    }
+    redis.reset(list(keys))
+    new_index = es_load.rebuild_start(item)
+    for partition in range(settings.etl_partitions):
+        pipeline.run(item, partition, rebuild=True)
+    es_load.rebuild_finish(item)
+    redis.finish_rebuild(keys, name, new_index)
+    redis.invalidate(name)
+    if item == MOVIES:
+        refresh_top(es_load, redis)
+
+
+def listen_changes(es_conn: Elasticsearch, pg_conn: _connection, listen_conn: _connection):
+    """
+    Выгрузка в es по уведомлениям PostgreSQL вместо опроса.
+    Все, что изменилось до запуска или было пропущено, догоняется
+    обычной выгрузкой при старте и раз в notify_resync секунд
+    """
+    postgres_to_es(es_conn, pg_conn)
+    pipeline = ETLPipeline(PG_DUMP(pg_conn), ES_LOAD(es_conn), ETLRedis())
+    for changes in PGListener(listen_conn).listen():
+        if changes is None:
             postgres_to_es(es_conn, pg_conn)
-            sleep(10)
\ No newline at end of file
+            continue
+        with pg_conn:
+            pipeline.load_changes(changes)
+
+
+def etl_worker(item: int, partition: int):
+    """
+    Воркер, выгружающий в es одну партицию одного индекса.
+    Каждый воркер работает в отдельном процессе со своими подключениями
+    """
+    with conn_context_es(settings.elastic_host, settings.elastic_port) as es_conn, \
+            conn_context_postgres(get_dsl(settings)) as pg_conn:
+        pipeline = ETLPipeline(PG_DUMP(pg_conn), ES_LOAD(es_conn), ETLRedis())
+        while True:
+            pipeline.run(item, partition)
+            sleep(settings.etl_sleep)
+
+
+def run_workers():
+    """
+    Запуск воркеров по всем индексам и партициям.
+    Упавший воркер перезапускается
+    """
+    workers = {}
+    while True:
+        for item in range(len(settings.elastic_index)):
+            for partition in range(settings.etl_partitions):
+                worker = workers.get((item, partition))
+                if worker is not None and worker.is_alive():
+                    continue
+                if worker is not None:
+                    logging.error(
+                        f'Worker {worker.name} exited with code {worker.exitcode}, restarting'
+                    )
+                worker = Process(
+                    target=etl_worker,
+                    args=(item, partition),
+                    name=f'etl_{settings.elastic_index[item]}_{partition}',
+                    daemon=True,
+                )
+                worker.start()
+                workers[(item, partition)] = worker
+        sleep(settings.etl_sleep)
+
+
+settings = Settings()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(name)s %(asctime)s %(levelname)s %(message)s',
+    )
+    parser = argparse.ArgumentParser(description='Перенос данных из PostgreSQL в Elasticsearch')
+    parser.add_argument(
+        '--rebuild',
+        nargs='+',
+        choices=settings.elastic_index,
+        help='пересобрать индексы без простоя и выйти',
+    )
+    args = parser.parse_args()
+    if args.rebuild:
+        with conn_context_es(settings.elastic_host, settings.elastic_port) as es_conn, \
+                conn_context_postgres(get_dsl(settings)) as pg_conn:
+            for name in args.rebuild:
+                rebuild_index(es_conn, pg_conn, settings.elastic_index.index(name))
+    else:
+        with conn_context_es(settings.elastic_host, settings.elastic_port) as es_conn, \
+                conn_context_postgres(get_dsl(settings)) as pg_conn:
+            bootstrap_indexes(es_conn, pg_conn)
+        Process(target=top_refresher, name='etl_top_refresher', daemon=True).start()
+        if settings.etl_mode == 'notify':
+            with conn_context_es(settings.elastic_host, settings.elastic_port) as es_conn, \
+                    conn_context_postgres(get_dsl(settings)) as pg_conn, \
+                    conn_context_postgres(get_dsl(settings)) as listen_conn:
+                listen_changes(es_conn, pg_conn, listen_conn)
+        elif settings.etl_workers:
+            run_workers()
+        else:
+            with conn_context_es(settings.elastic_host, settings.elastic_port) as es_conn, \
+                    conn_context_postgres(get_dsl(settings)) as pg_conn:
+                while True:
+                    postgres_to_es(es_conn, pg_conn)
+                    sleep(settings.etl_sleep)
@@ -1,5 +1,5 @@
 import logging
-from datetime import datetime
+import uuid
 
 from decorator import backoff
 from model_dataclasses import Filmwork, Genre, Person
@@ -9,24 +9,26 @@ from settings import Settings
 
 class PG_DUMP:
     UPDATED = ['''
-    SELECT DISTINCT fm.id 
-    FROM content.film_work AS fm
-    LEFT OUTER JOIN content.person_film_work AS pfm ON fm.id = pfm.film_work_id
-    LEFT OUTER JOIN content.person AS p ON pfm.person_id = p.id
-    LEFT OUTER JOIN content.genre_film_work AS gfm ON fm.id = gfm.film_work_id
-    LEFT OUTER JOIN content.genre AS g ON gfm.genre_id = g.id
-    WHERE fm.updated_at > '{lasttime}'
-    OR p.updated_at > '{lasttime}'
-    OR g.updated_at > '{lasttime}'
-    GROUP BY fm.id
+    SELECT id, updated_at
+    FROM content.film_work
+    WHERE (updated_at, id) > (%(updated_at)s, %(id)s::uuid)
+    AND updated_at < now() - %(lag)s * interval '1 second'
+    AND mod(hashtext(id::text)::bigint + 2147483648, %(partitions)s) = %(partition)s
+    ORDER BY updated_at, id
     ''', '''
-    SELECT DISTINCT id 
+    SELECT id, updated_at
     FROM content.genre
-    WHERE updated_at > '{lasttime}'
+    WHERE (updated_at, id) > (%(updated_at)s, %(id)s::uuid)
+    AND updated_at < now() - %(lag)s * interval '1 second'
+    AND mod(hashtext(id::text)::bigint + 2147483648, %(partitions)s) = %(partition)s
+    ORDER BY updated_at, id
     ''', '''
-    SELECT DISTINCT id
+    SELECT id, updated_at
     FROM content.person
-    WHERE updated_at > '{lasttime}'
+    WHERE (updated_at, id) > (%(updated_at)s, %(id)s::uuid)
+    AND updated_at < now() - %(lag)s * interval '1 second'
+    AND mod(hashtext(id::text)::bigint + 2147483648, %(partitions)s) = %(partition)s
+    ORDER BY updated_at, id
     ''']
     GETBYID = ['''
     SELECT
@@ -55,6 +57,24 @@ class PG_DUMP:
     FROM content.person
     WHERE id IN ({1})
     ''']
+    RELATED = [None, '''
+    SELECT DISTINCT film_work_id,
+        mod(hashtext(film_work_id::text)::bigint + 2147483648, %(partitions)s) AS partition
+    FROM content.genre_film_work
+    WHERE genre_id = ANY(%(ids)s::uuid[])
+    ''', '''
+    SELECT DISTINCT film_work_id,
+        mod(hashtext(film_work_id::text)::bigint + 2147483648, %(partitions)s) AS partition
+    FROM content.person_film_work
+    WHERE person_id = ANY(%(ids)s::uuid[])
+    ''']
+    PERSON_ROLES = '''
+    SELECT pfm.film_work_id, pfm.role, p.id AS person_id, p.full_name
+    FROM content.person_film_work AS pfm
+    JOIN content.person AS p ON pfm.person_id = p.id
+    WHERE pfm.person_id = ANY(%(ids)s::uuid[])
+    ORDER BY pfm.film_work_id
+    '''
 
     def __init__(self, conn):
         self.cnf = Settings()
@@ -62,14 +82,25 @@ class PG_DUMP:
         self.conn = conn
 
     @backoff(logger=logging.getLogger('pg_dump::_pg_id_query'))
-    def _pg_id_query(self, sqlquery: str, query_args: datetime) -> list:
+    def _pg_id_query(self, sqlquery: str, state: tuple, partition: int) -> list:
         """
-        Получение id обновленных сущностей
+        Получение id обновленных сущностей одной партиции.
+        Строки упорядочены по (updated_at, id) и читаются пачками
+        через серверный курсор, поэтому весь результат не держится в памяти.
+        Строки моложе etl_commit_lag секунд пропускаются до следующего
+        запуска: их транзакции могли еще не закоммититься, и строки
+        с меньшим updated_at появятся позже уже сохраненного состояния
         """
-        with self.conn as conn, conn.cursor() as cur:
-            cur.execute(sqlquery.format(lasttime=query_args))
+        with self.conn as conn, conn.cursor(name=f'etl_{uuid.uuid4().hex}') as cur:
+            cur.execute(sqlquery, {
+                'updated_at': state[0],
+                'id': state[1],
+                'lag': self.cnf.etl_commit_lag,
+                'partitions': self.cnf.etl_partitions,
+                'partition': partition,
+            })
             while current_fetch := cur.fetchmany(self.cnf.dump_size):
-                yield [row[0] for row in current_fetch]
+                yield current_fetch
 
     @backoff(logger=logging.getLogger('pg_dump::_pg_query'))
     def _pg_query(self, sqlquery: str, query_args: list) -> list:
@@ -81,8 +112,51 @@ class PG_DUMP:
         rows = cur.fetchall()
         return rows
 
-    def get_updated_id(self, index:int, updated_datetime: datetime) -> list:
-        return self._pg_id_query(self.UPDATED[index], updated_datetime)
+    @backoff(logger=logging.getLogger('pg_dump::_pg_related_query'))
+    def _pg_related_query(self, sqlquery: str, ids: list) -> list:
+        """
+        Получение фильмов, связанных с обновленными сущностями.
+        Поиск идет по индексам таблиц связей, строки читаются пачками
+        через серверный курсор: у популярных жанров и персон
+        связанных фильмов может быть очень много. Транзакция
+        не завершается: курсор читается, пока открыт серверный курсор
+        обновленных id, который коммит бы закрыл
+        """
+        with self.conn.cursor(name=f'etl_{uuid.uuid4().hex}') as cur:
+            cur.execute(sqlquery, {'ids': list(ids), 'partitions': self.cnf.etl_partitions})
+            while current_fetch := cur.fetchmany(self.cnf.dump_size):
+                yield current_fetch
+
+    def get_related_film_ids(self, index: int, ids: list) -> list:
+        """
+        Пачки id фильмов, в документы которых входят жанры или персоны ids
+        """
+        if self.RELATED[index] is None:
+            return
+        for rows in self._pg_related_query(self.RELATED[index], ids):
+            yield [row[0] for row in rows]
+
+    def get_related_films(self, index: int, ids: list) -> list:
+        """
+        Пачки строк (film_work_id, partition) фильмов, в документы
+        которых входят жанры или персоны ids, с партициями фильмов
+        """
+        if self.RELATED[index] is None:
+            return
+        yield from self._pg_related_query(self.RELATED[index], ids)
+
+    def get_person_roles(self, ids: list) -> list:
+        """
+        Пачки строк (film_work_id, role, person_id, full_name)
+        по всем фильмам персон ids
+        """
+        return self._pg_related_query(self.PERSON_ROLES, ids)
+
+    def get_updated_id(self, index: int, state: tuple, partition: int = 0) -> list:
+        """
+        Пачки строк (id, updated_at) с ключом больше state = (updated_at, id)
+        """
+        return self._pg_id_query(self.UPDATED[index], state, partition)
 
     def get_by_id(self, index:int, ids: list):
         return [self.dataclasses[index](*row) for row in self._pg_query(self.GETBYID[index], ids)]
\ No newline at end of file
@@ -0,0 +1,342 @@
+import logging
+from dataclasses import dataclass, field
+from queue import Full, Queue
+from threading import Event, Thread
+from time import monotonic
+from typing import Optional
+
+from es_load import ES_LOAD
+from etl_redis import ETLRedis
+from pg_dump import PG_DUMP
+from settings import Settings
+
+MOVIES, GENRES, PERSONS = range(3)
+
+# поля документов, которых нет в списках search_service и по которым
+# не ищут, не фильтруют и не сортируют: их изменение списков не меняет
+LIST_STATIC_FIELDS = {'type'}
+
+logger = logging.getLogger('pipeline')
+
+
+@dataclass
+class StageStats:
+    """
+    Статистика одной стадии конвейера
+    """
+    name: str
+    batches: int = 0
+    docs: int = 0
+    busy: float = 0.0
+    depth: int = 0
+    depth_samples: int = 0
+
+    def add(self, docs: int, busy: float):
+        self.batches += 1
+        self.docs += docs
+        self.busy += busy
+
+    def sample_depth(self, depth: int):
+        """
+        Замер глубины очереди перед стадией: хранятся только сумма
+        и число замеров, память не растет с числом пачек
+        """
+        self.depth += depth
+        self.depth_samples += 1
+
+    def avg_depth(self) -> float:
+        return self.depth / self.depth_samples if self.depth_samples else 0.0
+
+    def throughput(self, elapsed: float) -> float:
+        return self.docs / elapsed if elapsed else 0.0
+
+    def utilization(self, elapsed: float) -> float:
+        return self.busy / elapsed if elapsed else 0.0
+
+
+@dataclass
+class Batch:
+    """
+    Пачка, готовая к загрузке в индекс item: документы целиком,
+    частичные обновления персон в фильмах {id фильма: {id персоны: имя}}
+    и ключ (updated_at, id) последней строки пачки. У пачек фильмов,
+    затронутых изменением жанров и персон, ключа нет
+    """
+    item: int
+    docs: list = field(default_factory=list)
+    persons: dict = field(default_factory=dict)
+    last_key: tuple = None
+
+
+class ETLPipeline:
+    """
+    Конвейер postgres -> es: пока es индексирует одну пачку,
+    из postgres уже читается следующая. Очередь между стадиями
+    ограничена pipeline_size пачками, поэтому при замедлении es
+    чтение из postgres приостанавливается.
+    """
+    _DONE = object()
+
+    def __init__(self, pg_dump: PG_DUMP, es_load: ES_LOAD, redis: ETLRedis):
+        self.cnf = Settings()
+        self.pg_dump = pg_dump
+        self.es_load = es_load
+        self.redis = redis
+
+    def run(self, item: int, partition: int = 0, rebuild: bool = False):
+        """
+        Выгрузка в es одной партиции одного индекса.
+        Фильмы, затронутые изменением жанров и персон, ставятся
+        в очередь своей партиции и перевыгружаются в конце выгрузки
+        этой партиции фильмов.
+        При пересборке состояние ведется отдельно, а зависимые
+        фильмы не обновляются: новый индекс собирается с нуля
+        """
+        key = self.redis.state_key(self.cnf.elastic_index[item], partition, rebuild)
+        state = self.redis.get_state(key)
+        queue = Queue(maxsize=self.cnf.pipeline_size)
+        stop = Event()
+        extract = StageStats('extract')
+        load = StageStats('load')
+        started = reported = monotonic()
+        finished = False
+
+        producer = Thread(
+            target=self._extract,
+            args=(queue, stop, extract, item, state, partition, not rebuild),
+            name=f'extract_{key}',
+            daemon=True,
+        )
+        producer.start()
+        try:
+            while True:
+                load.sample_depth(queue.qsize())
+                batch = queue.get()
+                if batch is self._DONE:
+                    finished = True
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                load_start = monotonic()
+                hashes = self._load(batch)
+                if hashes is None:
+                    logger.error(f'{key}: batch was not loaded, stop at {state}')
+                    break
+                if batch.last_key is not None:
+                    state = batch.last_key
+                    self.redis.commit(key, state, hashes)
+                else:
+                    self.redis.commit(hashes=hashes)
+                load.add(len(batch.docs) + len(batch.persons), monotonic() - load_start)
+                if monotonic() - reported >= self.cnf.pipeline_report_interval:
+                    self._report(key, started, extract, load)
+                    reported = monotonic()
+        finally:
+            stop.set()
+            producer.join()
+        if finished and item == MOVIES and not rebuild:
+            self._load_fan_out(partition, load)
+        if load.batches:
+            self._report(key, started, extract, load)
+
+    def load_changes(self, changes: dict) -> bool:
+        """
+        Выгрузка в es изменений, полученных из уведомлений PostgreSQL,
+        без изменения состояния
+        """
+        for item, ids in sorted(changes.items()):
+            ids = list(ids)
+            for start in range(0, len(ids), self.cnf.dump_size):
+                batch_ids = ids[start:start + self.cnf.dump_size]
+                batches = list(self._fan_out(item, batch_ids))
+                batches.append(Batch(item, self.pg_dump.get_by_id(item, batch_ids)))
+                for batch in batches:
+                    hashes = self._load(batch)
+                    if hashes is None:
+                        logger.error(f'{self.cnf.elastic_index[item]}: changes were not loaded')
+                        return False
+                    self.redis.commit(hashes=hashes)
+        return True
+
+    def _load(self, batch: Batch) -> Optional[dict]:
+        """
+        Запись пачки в es. В режиме bulk_diff неизмененные документы
+        пропускаются, у измененных отправляются только изменившиеся поля.
+        Записанные документы сбрасываются из кеша поиска, а если
+        запись может изменить состав или содержимое страниц (новые
+        документы, измененные поля списков, поиска, фильтров
+        и сортировки) - и все списки индекса. Документы, записанные
+        целиком, добавляются в фильтр Блума индекса. Списки лучших
+        фильмов после такой записи помечаются к пересчету.
+        Возвращает новые хэши документов для сохранения вместе
+        с состоянием или None, если пачка не записана
+        """
+        index = self.es_load.index_name(batch.item)
+        hashes = {}
+        docs = batch.docs
+        results = []
+        written = [str(film_id) for film_id in batch.persons]
+        # имена персон есть в списках фильмов и в поиске
+        lists_changed = bool(batch.persons)
+        if docs and self.cnf.bulk_diff:
+            old_hashes = self.redis.get_hashes(index, [str(doc.id) for doc in docs])
+            docs, changed, hashes[index] = self.es_load.diff(docs, old_hashes)
+            lists_changed = lists_changed or any(
+                set(fields) - LIST_STATIC_FIELDS for fields in changed.values()
+            )
+            if changed:
+                results.append(self.es_load.bulk_partial(
+                    batch.item, changed, {str(doc.id): doc for doc in batch.docs}
+                ))
+                written.extend(changed)
+        if docs:
+            # новые документы, а без bulk_diff неизвестно, что изменилось
+            lists_changed = True
+            results.append(self.es_load.bulk_update(batch.item, docs))
+            written.extend(str(doc.id) for doc in docs)
+            # фильтр Блума пересобираемого индекса станет основным вместе с ним
+            self.redis.bloom_add(index, [str(doc.id) for doc in docs])
+        if batch.persons:
+            results.append(self.es_load.update_persons(batch.item, batch.persons))
+        if None in results:
+            return None
+        if written and index == self.cnf.elastic_index[batch.item]:
+            # при пересборке новый индекс еще не виден поиску
+            self.redis.invalidate(index, written, lists_changed)
+            if batch.item == MOVIES and lists_changed:
+                self.redis.top_mark(index)
+        if False in results:
+            # часть документов ушла в dead letter, их хэши не сохраняем
+            return {}
+        return hashes
+
+    def _load_fan_out(self, partition: int, stats: StageStats):
+        """
+        Перевыгрузка фильмов из очереди партиции, куда их ставят
+        выгрузки жанров и персон. Документы фильмов пишет только
+        воркер их партиции, поэтому параллельные воркеры не затирают
+        новые версии фильмов старыми. Фильмы читаются из postgres
+        после постановки в очередь, а снимаются из нее, только если
+        не были поставлены заново, пока шла запись
+        """
+        index = self.cnf.elastic_index[MOVIES]
+        while queued := self.redis.fan_out_take(index, partition, self.cnf.dump_size):
+            load_start = monotonic()
+            # транзакция чтения завершается сразу, воркер не висит
+            # в idle in transaction до следующего прохода
+            with self.pg_dump.conn:
+                docs = self.pg_dump.get_by_id(MOVIES, list(queued))
+            hashes = self._load(Batch(MOVIES, docs))
+            if hashes is None:
+                logger.error(f'{self.redis.fan_out_key(index, partition)}: queued films were not loaded')
+                return
+            self.redis.commit(hashes=hashes)
+            self.redis.fan_out_done(index, partition, queued)
+            stats.add(len(queued), monotonic() - load_start)
+
+    def _queue_fan_out(self, item: int, ids: list):
+        """
+        Постановка фильмов, затронутых изменением жанров или персон ids,
+        в очереди их партиций
+        """
+        for rows in self.pg_dump.get_related_films(item, ids):
+            films = {}
+            for film_id, partition in rows:
+                films.setdefault(partition, []).append(str(film_id))
+            self.redis.fan_out_add(self.cnf.elastic_index[MOVIES], films)
+
+    def _fan_out(self, item: int, ids: list):
+        """
+        Пачки фильмов, затронутых изменением жанров или персон ids,
+        для выгрузки по уведомлениям.
+        Фильмы ищутся по таблицам связей без общего join по каталогу.
+        Для актеров и сценаристов в документах фильмов обновляются
+        только имена, фильмы с измененными режиссерами и жанрами
+        перевыгружаются целиком
+        """
+        if item == PERSONS:
+            for rows in self.pg_dump.get_person_roles(ids):
+                rebuild = {row['film_work_id'] for row in rows if row['role'] == 'director'}
+                persons = {}
+                for row in rows:
+                    if row['film_work_id'] not in rebuild:
+                        persons.setdefault(row['film_work_id'], {})[row['person_id']] = row['full_name']
+                docs = self.pg_dump.get_by_id(MOVIES, list(rebuild)) if rebuild else []
+                yield Batch(MOVIES, docs, persons)
+        elif item == GENRES:
+            for film_ids in self.pg_dump.get_related_film_ids(item, ids):
+                yield Batch(MOVIES, self.pg_dump.get_by_id(MOVIES, film_ids))
+
+    def _extract(
+            self,
+            queue: Queue,
+            stop: Event,
+            stats: StageStats,
+            item: int,
+            state: tuple,
+            partition: int,
+            fan_out: bool = True,
+    ):
+        """
+        Стадия чтения из postgres, работает в отдельном потоке.
+        Затронутые фильмы ставятся в очереди партиций раньше,
+        чем пачка жанров или персон попадает в конвейер, поэтому
+        состояние сдвигается только после постановки всех
+        зависимых документов
+        """
+        try:
+            rows_batches = self.pg_dump.get_updated_id(item, state, partition)
+            while not stop.is_set():
+                extract_start = monotonic()
+                rows = next(rows_batches, None)
+                if rows is None:
+                    break
+                ids = [row['id'] for row in rows]
+                if fan_out:
+                    self._queue_fan_out(item, ids)
+                batch = Batch(
+                    item,
+                    self.pg_dump.get_by_id(item, ids),
+                    last_key=(rows[-1]['updated_at'], rows[-1]['id']),
+                )
+                stats.add(len(batch.docs), monotonic() - extract_start)
+                self._put(queue, stop, batch)
+            rows_batches.close()
+        except Exception as e:
+            logger.exception(e)
+            self._put(queue, stop, e)
+            return
+        self._put(queue, stop, self._DONE)
+
+    @staticmethod
+    def _put(queue: Queue, stop: Event, batch):
+        """
+        Блокирующая запись в очередь, прерываемая остановкой конвейера
+        """
+        while not stop.is_set():
+            try:
+                queue.put(batch, timeout=1)
+                return
+            except Full:
+                continue
+
+    def _report(
+            self,
+            key: str,
+            started: float,
+            extract: StageStats,
+            load: StageStats,
+    ):
+        """
+        Логирование пропускной способности стадий и глубины очереди.
+        Очередь почти всегда полная - узкое место es,
+        почти всегда пустая - postgres
+        """
+        elapsed = monotonic() - started
+        logger.info(
+            f'{key}: extract {extract.docs} docs '
+            f'({extract.throughput(elapsed):.1f} docs/s, busy {extract.utilization(elapsed):.0%}), '
+            f'load {load.docs} docs '
+            f'({load.throughput(elapsed):.1f} docs/s, busy {load.utilization(elapsed):.0%}), '
+            f'queue depth {load.avg_depth():.1f}/{self.cnf.pipeline_size}'
+        )
@@ -18,5 +18,43 @@ class Settings(BaseSettings):
     elastic_index: list
     dump_size: int
 
+    etl_sleep: float = 10
+    etl_workers: bool = False
+    etl_partitions: int = 1
+    etl_commit_lag: float = 2
+    etl_mode: str = 'poll'
+
+    notify_debounce: float = 0.5
+    notify_resync: float = 600
+
+    pipeline_size: int = 2
+    pipeline_report_interval: float = 30
+
+    bulk_chunk_size: int = 500
+    bulk_max_chunk_bytes: int = 10 * 1024 * 1024
+    bulk_thread_count: int = 4
+    bulk_max_retries: int = 5
+    bulk_dead_letter: str = 'dead_letter.jsonl'
+    bulk_diff: bool = True
+
+    cache_invalidate_channel: str = 'cache_invalidate'
+    cache_tag_prefix: str = 'tag'
+    cache_generation_prefix: str = 'generation'
+
+    bloom_key_prefix: str = 'bloom'
+    bloom_bits: int = 2 ** 23
+    bloom_hashes: int = 7
+
+    top_key_prefix: str = 'top'
+    # не больше index.max_inner_result_window индекса фильмов (100)
+    top_size: int = 100
+    top_max_genres: int = 500
+    top_refresh_interval: float = 30
+    # поля ElasticFilmWork search_service: только их отдает /films/top/
+    top_source_fields: list = [
+        'id', 'imdb_rating', 'genre', 'title', 'description', 'director',
+        'actors_names', 'writers_names', 'actors', 'writers',
+    ]
+
     class Config:
         env_file = os.environ.get('PATH')
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Сравнение записи, чтения и удаления N ключей в Redis по одному
+и пакетно: mset/mget/delete_many через пайплайн и MGET.
+Запуск из каталога search_service:
+    PYTHONPATH=. python benchmarks/cache_roundtrips.py --keys 100 --repeat 20
+"""
+import argparse
+import asyncio
+import uuid
+from time import perf_counter
+
+import aioredis
+from src.core.config import settings
+from src.db.redis import RedisCacheProvider
+
+
+async def measure(func, repeat: int) -> float:
+    """
+    Среднее время одного вызова func в миллисекундах
+    """
+    start = perf_counter()
+    for _ in range(repeat):
+        await func()
+    return (perf_counter() - start) / repeat * 1000
+
+
+async def main(keys_count: int, repeat: int, value_size: int):
+    redis_client = await aioredis.create_redis(
+        (settings.REDIS_HOST, settings.REDIS_PORT)
+    )
+    cache = RedisCacheProvider(redis_client)
+    prefix = f'benchmark::{uuid.uuid4().hex}::'
+    keys = [f'{prefix}{number}' for number in range(keys_count)]
+    values = {key: b'x' * value_size for key in keys}
+
+    async def set_one_by_one():
+        for key, value in values.items():
+            await cache.set(key=key, value=value, expire=60)
+
+    async def get_one_by_one():
+        for key in keys:
+            await cache.get(key=key)
+
+    async def delete_one_by_one():
+        for key in keys:
+            await cache.delete_many([key])
+
+    async def set_batch():
+        await cache.mset(values, expire={key: 60 for key in keys})
+
+    async def get_batch():
+        await cache.mget(keys)
+
+    async def delete_batch():
+        await cache.delete_many(keys)
+
+    try:
+        print(f'{keys_count} keys, {value_size} bytes, {repeat} repeats')
+        print(f'{"":8}{"one by one":>22}{"batch":>22}')
+        for name, single, batch in (
+                ('set', set_one_by_one, set_batch),
+                ('get', get_one_by_one, get_batch),
+                ('delete', delete_one_by_one, delete_batch),
+        ):
+            single_ms = await measure(single, repeat)
+            if name == 'delete':
+                await set_batch()
+            batch_ms = await measure(batch, repeat)
+            await set_batch()
+            print(
+                f'{name:8}'
+                f'{single_ms:>9.2f} ms {keys_count:>5} rtt'
+                f'{batch_ms:>9.2f} ms {1:>5} rtt'
+                f'   x{single_ms / batch_ms:.1f}'
+            )
+    finally:
+        await cache.delete_many(keys)
+        redis_client.close()
+        await redis_client.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--value-size', type=int, default=512)
+    args = parser.parse_args()
+    asyncio.run(main(args.keys, args.repeat, args.value_size))
@@ -1,14 +1,15 @@
 import logging
 from http import HTTPStatus
 from logging import config as logging_config
-from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response
 from src.core.logger import LOGGING
 from src.models.data_models import ElasticFilmWork, Film
 from src.services.film import FilmService, get_film_service
 
-from .params import PaginatedParams
+from .params import FilterParams, IdsParams, PaginatedParams
+from .responses import cached_response
 
 FILM_NOT_FOUN_STR = 'film not found'
 
@@ -19,66 +20,88 @@ logger.debug('Start logging')
 router = APIRouter()
 
 
+@router.post('/_mget',
+             description='Вывод нескольких фильмов по списку id в порядке запроса')
+async def films_mget(
+        params: IdsParams,
+        film_service: FilmService = Depends(get_film_service)
+) -> Response:
+    films = await film_service.get_films_by_ids(params.ids)
+    return Response(content=films, media_type='application/json')
+
+
+@router.get('/top/',
+            description='Лучшие по рейтингу фильмы, все или одного жанра')
+async def get_top_films(
+        request: Request,
+        genre: str = Query('', description='Жанр, без учета регистра.'),
+        film_service: FilmService = Depends(get_film_service),
+        pagination: PaginatedParams = Depends(PaginatedParams)
+) -> Response:
+    films = await film_service.get_top_films(
+        page_size=pagination.page_size,
+        page_number=pagination.page_number,
+        genre=genre,
+        cursor=pagination.cursor)
+    if not films:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=FILM_NOT_FOUN_STR)
+
+    return cached_response(films, request, 'list')
+
+
 @router.get('/{film_id}',
             response_model=Film,
             description='Вывод одного фильма по id')
 async def film_details(
+        request: Request,
         film_id: str,
         film_service: FilmService = Depends(get_film_service)
-) -> Film:
+) -> Response:
     film = await film_service.get_film_by_id(film_id)
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=FILM_NOT_FOUN_STR)
-    return Film(id=film.id,
-                title=film.title,
-                description=film.description)
+    return cached_response(film, request, 'detail')
 
 
 @router.get("/",
             description='Вывод всех фильм учитывая сортировку и фильтр')
 async def get_all_films(
-        sort="",
-        filter_name="",
-        filter_arg="",
+        request: Request,
+        filtering: FilterParams = Depends(FilterParams),
         film_service: FilmService = Depends(get_film_service),
         pagination: PaginatedParams = Depends(PaginatedParams)
-) -> Optional[list[Film]]:
+) -> Response:
     films = await film_service.get_all_films(
         page_size=pagination.page_size,
         page_number=pagination.page_number,
-        sort=sort,
-        filter_name=filter_name,
-        filter_arg=filter_arg)
+        cursor=pagination.cursor,
+        sort=filtering.sort,
+        filters=filtering.filters)
     if not films:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=FILM_NOT_FOUN_STR)
 
-    return {
-        "page_size": pagination.page_size,
-        "page_number": pagination.page_number,
-        "values": films
-    }
+    return cached_response(films, request, 'list')
 
 
 @router.get("/search/",
             description='Поиск фильмов по запросу')
 async def get_search_films(
+        request: Request,
         query: str,
         film_service: FilmService = Depends(get_film_service),
         pagination: PaginatedParams = Depends(PaginatedParams)
-) -> Optional[list[Film]]:
+) -> Response:
     films = await film_service.get_search_films(
         page_size=pagination.page_size,
         page_number=pagination.page_number,
+        cursor=pagination.cursor,
         query=query
     )
     if not films:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=FILM_NOT_FOUN_STR)
 
-    return {
-        "page_size": pagination.page_size,
-        "page_number": pagination.page_number,
-        "values": films
-    }
+    return cached_response(films, request, 'search')
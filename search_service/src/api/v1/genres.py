@@ -1,14 +1,15 @@
 import logging
 from http import HTTPStatus
 from logging import config as logging_config
-from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
 from src.core.logger import LOGGING
 from src.models.data_models import Genre
 from src.services.genre import GenreService, get_genre_service
 
-from .params import PaginatedParams
+from .params import FilterParams, IdsParams, PaginatedParams
+from .responses import cached_response
 
 GENRE_NOT_FOUND_STR = 'genres not found'
 
@@ -19,64 +20,66 @@ logger.debug('Start logging')
 router = APIRouter()
 
 
+@router.post('/_mget',
+             description='Вывод нескольких жанров по списку id в порядке запроса')
+async def genres_mget(
+        params: IdsParams,
+        genre_service: GenreService = Depends(get_genre_service)
+) -> Response:
+    genres = await genre_service.get_genres_by_ids(params.ids)
+    return Response(content=genres, media_type='application/json')
+
+
 @router.get('/{genre_id}',
             response_model=Genre,
             description='Вывод одного жанра по id')
 async def genre_details(
+        request: Request,
         genre_id: str,
         genre_service: GenreService = Depends(get_genre_service)
-) -> Genre:
+) -> Response:
     genre = await genre_service.get_genre_by_id(genre_id)
     if not genre:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=GENRE_NOT_FOUND_STR)
-    return Genre(id=genre.id,
-                 name=genre.name,
-                 description=genre.description)
+    return cached_response(genre, request, 'detail')
 
 
 @router.get("/",
             description='Вывод всех жанров с учетом фильтров и сортировки')
-async def get_all_genres(pagination: PaginatedParams = Depends(PaginatedParams),
-                         sort="",
-                         filter_name="",
-                         filter_arg="",
+async def get_all_genres(request: Request,
+                         pagination: PaginatedParams = Depends(PaginatedParams),
+                         filtering: FilterParams = Depends(FilterParams),
                          genre_service: GenreService = Depends(get_genre_service)
-                         ) -> Optional[list[Genre]]:
+                         ) -> Response:
     logger.debug('Open api with all genres')
 
     genres = await genre_service.get_all_genres(page_size=pagination.page_size,
                                                 page_number=pagination.page_number,
-                                                sort=sort,
-                                                filter_name=filter_name,
-                                                filter_arg=filter_arg)
+                                                cursor=pagination.cursor,
+                                                sort=filtering.sort,
+                                                filters=filtering.filters)
     if not genres:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=GENRE_NOT_FOUND_STR)
 
-    return {
-        "page_size": pagination.page_size,
-        "page_number": pagination.page_number,
-        "values":genres
-    }
+    return cached_response(genres, request, 'list')
 
 
 @router.get("/search/",
             description='Поиск жанров по запросу')
 async def get_search_genres(
+                            request: Request,
                             query: str,
                             genre_service: GenreService = Depends(get_genre_service),
                             pagination: PaginatedParams = Depends(PaginatedParams)
-                            ) -> Optional[list[Genre]]:
+                            ) -> Response:
     genres = await genre_service.get_search_genres(page_size=pagination.page_size,
                                                    page_number=pagination.page_number,
+                                                   cursor=pagination.cursor,
                                                    query=query)
     if not genres:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=GENRE_NOT_FOUND_STR)
 
-    return {
-        "page_size": pagination.page_size,
-        "page_number": pagination.page_number,
-        "values":genres
-    }
+    return cached_response(genres, request, 'search')
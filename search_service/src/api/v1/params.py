@@ -1,4 +1,7 @@
-from fastapi import Query
+from typing import Optional
+
+from fastapi import Query, Request
+from pydantic import BaseModel, Field
 from src.core.config import settings
 
 
@@ -19,7 +22,54 @@ class PaginatedParams:
                 alias='page[number]',
                 description='Номер страницы.',
                 ge=1
+            ),
+            cursor: Optional[str] = Query(
+                None,
+                alias='page[cursor]',
+                description='Курсор следующей страницы из next_cursor. '
+                            'Стоимость страницы не зависит от ее номера.'
             )
     ):
         self.page_size = page_size
-        self.page_number = page_number
\ No newline at end of file
+        self.page_number = page_number
+        self.cursor = cursor
+
+
+class FilterParams:
+    """
+    Фильтры и сортировка списков. Фильтры - filter[<поле>]=<значение>,
+    сколько угодно, или одна пара filter_name и filter_arg.
+    """
+    def __init__(
+            self,
+            request: Request,
+            sort: str = Query(
+                '',
+                description='Поле сортировки, <поле>[:asc|desc], '
+                            'по умолчанию по убыванию.'
+            ),
+            filter_name: str = Query(
+                '',
+                description='Поле фильтра. Несколько фильтров - '
+                            'параметры filter[<поле>]=<значение>.'
+            ),
+            filter_arg: str = Query(
+                '',
+                description='Значение фильтра, для чисел - <от>..<до>.'
+            )
+    ):
+        self.sort = sort
+        self.filters = {
+            name[len('filter['):-1]: value
+            for name, value in request.query_params.items()
+            if name.startswith('filter[') and name.endswith(']')
+        }
+        if filter_name and filter_arg:
+            self.filters[filter_name] = filter_arg
+
+
+class IdsParams(BaseModel):
+    """
+    Список id для получения нескольких документов одним запросом.
+    """
+    ids: list[str] = Field(..., min_items=1, max_items=settings.MGET_MAX_IDS)
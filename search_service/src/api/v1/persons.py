@@ -1,14 +1,15 @@
 import logging
 from http import HTTPStatus
 from logging import config as logging_config
-from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
 from src.core.logger import LOGGING
 from src.models.data_models import Person
 from src.services.person import PersonService, get_person_service
 
-from .params import PaginatedParams
+from .params import FilterParams, IdsParams, PaginatedParams
+from .responses import cached_response
 
 PERSON_NOT_FOUND_STR = 'persons not found'
 
@@ -19,63 +20,67 @@ logger.debug('Start logging')
 router = APIRouter()
 
 
+@router.post('/_mget',
+             description='Вывод нескольких персон по списку id в порядке запроса')
+async def persons_mget(
+        params: IdsParams,
+        person_service: PersonService = Depends(get_person_service)
+) -> Response:
+    persons = await person_service.get_persons_by_ids(params.ids)
+    return Response(content=persons, media_type='application/json')
+
+
 @router.get('/{person_id}',
             response_model=Person,
             description='Вывод персоны по id')
 async def person_details(
+        request: Request,
         person_id: str,
         person_service: PersonService = Depends(get_person_service)
-) -> Person:
+) -> Response:
     person = await person_service.get_person_by_id(person_id)
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=PERSON_NOT_FOUND_STR)
-    return Person(id=person.id, full_name=person.full_name)
+    return cached_response(person, request, 'detail')
 
 
 @router.get("/",
             description='Вывод всех персон учитывая фильтры и сортировку')
-async def get_all_persons(pagination: PaginatedParams = Depends(PaginatedParams),
-                          sort="",
-                          filter_name="",
-                          filter_arg="",
+async def get_all_persons(request: Request,
+                          pagination: PaginatedParams = Depends(PaginatedParams),
+                          filtering: FilterParams = Depends(FilterParams),
                           person_service: PersonService = Depends(get_person_service)
-                          ) -> Optional[list[Person]]:
+                          ) -> Response:
     logger.debug('Open api with all persons')
 
     persons = await person_service.get_all_persons(page_size=pagination.page_size,
                                                    page_number=pagination.page_number,
-                                                   sort=sort,
-                                                   filter_name=filter_name,
-                                                   filter_arg=filter_arg)
+                                                   cursor=pagination.cursor,
+                                                   sort=filtering.sort,
+                                                   filters=filtering.filters)
     if not persons:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=PERSON_NOT_FOUND_STR)
 
-    return {
-        "page_size": pagination.page_size,
-        "page_number": pagination.page_number,
-        "values":persons
-    }
+    return cached_response(persons, request, 'list')
 
 
 @router.get("/search/",
             description='Поиск персон по запросу')
 async def get_search_persons(
+                            request: Request,
                             query: str,
                             person_service: PersonService = Depends(get_person_service),
                             pagination: PaginatedParams = Depends(PaginatedParams)
-                           ) -> Optional[list[Person]]:
+                           ) -> Response:
     persons = await person_service.get_search_persons(page_size=pagination.page_size,
                                                       page_number=pagination.page_number,
+                                                      cursor=pagination.cursor,
                                                       query=query)
     if not persons:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=PERSON_NOT_FOUND_STR)
 
-    return {
-        "page_size": pagination.page_size,
-        "page_number": pagination.page_number,
-        "values":persons
-    }
+    return cached_response(persons, request, 'search')
 
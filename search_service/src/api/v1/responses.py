@@ -0,0 +1,52 @@
+import gzip
+import hashlib
+from http import HTTPStatus
+
+from fastapi import Request
+from fastapi.responses import Response
+from src.core.config import settings
+from src.services.base import GZIP_MAGIC
+
+
+def etag(body: bytes) -> str:
+    """
+    Сильный ETag по телу ответа из кеша
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def not_modified(request: Request, tag: str) -> bool:
+    """
+    If-None-Match сравнивается слабо: nginx, сжимая ответ сам,
+    превращает ETag в W/"..."
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    tags = [value.strip().removeprefix('W/') for value in if_none_match.split(',')]
+    return '*' in tags or tag in tags
+
+
+def cached_response(body: bytes, request: Request, policy: str) -> Response:
+    """
+    Ответ готовым телом из кеша, без моделей и повторной сериализации.
+    Сжатое тело отдается как есть, если клиент принимает gzip.
+    Если у клиента уже есть этот ответ (If-None-Match), отдается 304.
+    policy - имя политики из CACHE_POLICIES для Cache-Control
+    """
+    tag = etag(body)
+    headers = {
+        'Cache-Control': f'public, max-age={settings.CACHE_POLICIES[policy].max_age}',
+    }
+    if body.startswith(GZIP_MAGIC):
+        headers['Vary'] = 'Accept-Encoding'
+        if 'gzip' in request.headers.get('accept-encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+            # у сжатого и несжатого представлений разные ETag
+            tag = f'{tag[:-1]}-gzip"'
+        else:
+            body = gzip.decompress(body)
+    headers['ETag'] = tag
+    if not_modified(request, tag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
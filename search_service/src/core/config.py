@@ -1,10 +1,50 @@
 import os
 from logging import config as logging_config
+from typing import Optional
 
-from pydantic import BaseSettings
+from pydantic import BaseModel, BaseSettings
 from src.core.logger import LOGGING
 
 
+class CachePolicy(BaseModel):
+    """
+    Время жизни записей кеша одного вида запросов.
+    После soft_ttl запись отдается устаревшей и обновляется в фоне,
+    после hard_ttl удаляется из Redis. max_age - сколько ответ
+    могут хранить клиенты и nginx (Cache-Control)
+    """
+    soft_ttl: float
+    hard_ttl: float
+    max_age: int
+
+
+def cache_policy(name: str, soft_ttl: float, hard_ttl: float, max_age: int) -> CachePolicy:
+    return CachePolicy(
+        soft_ttl=float(os.getenv(f'CACHE_{name}_SOFT_TTL', soft_ttl)),
+        hard_ttl=float(os.getenv(f'CACHE_{name}_HARD_TTL', hard_ttl)),
+        max_age=int(os.getenv(f'CACHE_{name}_MAX_AGE', max_age)),
+    )
+
+
+class SearchProfile(BaseModel):
+    """
+    Поля полнотекстового поиска индекса с весами (поле^вес)
+    и keyword-поле exact, точное совпадение с которым поднимается наверх
+    """
+    fields: list[str]
+    exact: Optional[str] = None
+
+
+class FilterField(BaseModel):
+    """
+    Поле индекса, по которому разрешен фильтр списков, и вид фильтра:
+    term - точное совпадение keyword-поля, range - диапазон чисел
+    <от>..<до>, match - все слова значения в текстовом поле
+    """
+    field: str
+    kind: str
+
+
 class Settings(BaseSettings):
     logging_config.dictConfig(LOGGING)
     PROJECT_NAME = os.getenv('PROJECT_NAME', 'movies')
@@ -12,10 +52,76 @@ class Settings(BaseSettings):
     REDIS_PORT = int(os.getenv('BROKER_PORT', 6379))
     ELASTIC_HOST = os.getenv('ELASTIC_HOST', '127.0.0.1')
     ELASTIC_PORT = int(os.getenv('ELASTIC_PORT', 9200))
+    ELASTIC_PIT_KEEP_ALIVE = os.getenv('ELASTIC_PIT_KEEP_ALIVE', '1m')
+    # описание и вложенные персоны в поиск не входят
+    SEARCH_PROFILES = {
+        'movies': SearchProfile(
+            fields=['title^3', 'director^1.5', 'actors_names', 'writers_names'],
+            exact='title.raw'
+        ),
+        'genres': SearchProfile(fields=['name'], exact='name.raw'),
+        'persons': SearchProfile(fields=['full_name'], exact='full_name.raw'),
+    }
+    # фильтры списков: имя в запросе - поле индекса
+    FILTER_FIELDS = {
+        'movies': {
+            'genre': FilterField(field='genre', kind='term'),
+            'imdb_rating': FilterField(field='imdb_rating', kind='range'),
+            'title': FilterField(field='title', kind='match'),
+            'director': FilterField(field='director', kind='match'),
+            'actors_names': FilterField(field='actors_names', kind='match'),
+            'writers_names': FilterField(field='writers_names', kind='match'),
+        },
+        'genres': {'name': FilterField(field='name', kind='match')},
+        'persons': {'full_name': FilterField(field='full_name', kind='match')},
+    }
+    # сортировка только по полям с doc values
+    SORT_FIELDS = {
+        'movies': {'imdb_rating': 'imdb_rating', 'title': 'title.raw'},
+        'genres': {'name': 'name.raw'},
+        'persons': {'full_name': 'full_name.raw'},
+    }
+    # первые символы слова нечеткий поиск не меняет
+    SEARCH_FUZZY_PREFIX_LENGTH = int(os.getenv('SEARCH_FUZZY_PREFIX_LENGTH', 1))
+    SEARCH_FUZZY_MAX_EXPANSIONS = int(os.getenv('SEARCH_FUZZY_MAX_EXPANSIONS', 20))
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     default_page_size = 3
     default_page_number = 1
+    MGET_MAX_IDS = int(os.getenv('MGET_MAX_IDS', 100))
     FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+    LOCAL_CACHE_SIZE = int(os.getenv('LOCAL_CACHE_SIZE', 1024))
+    LOCAL_CACHE_EXPIRE_IN_SECONDS = float(os.getenv('LOCAL_CACHE_EXPIRE_IN_SECONDS', 10))
+    CACHE_INVALIDATE_CHANNEL = os.getenv('CACHE_INVALIDATE_CHANNEL', 'cache_invalidate')
+    CACHE_TAG_PREFIX = os.getenv('CACHE_TAG_PREFIX', 'tag')
+    # поколение списков индекса ведет ETL, оно входит в ключи списков
+    CACHE_GENERATION_PREFIX = os.getenv('CACHE_GENERATION_PREFIX', 'generation')
+    # смена версии уводит все ключи списков в новое пространство имен
+    CACHE_KEY_VERSION = int(os.getenv('CACHE_KEY_VERSION', 1))
+    CACHE_STATS_KEY = os.getenv('CACHE_STATS_KEY', 'cache_stats')
+    CACHE_STATS_FLUSH_INTERVAL = float(os.getenv('CACHE_STATS_FLUSH_INTERVAL', 10))
+    # отсутствие документа или пустая страница кешируются ненадолго
+    CACHE_NEGATIVE_TTL = float(os.getenv('CACHE_NEGATIVE_TTL', 30))
+    # размеры фильтра Блума должны совпадать с настройками ETL
+    BLOOM_KEY_PREFIX = os.getenv('BLOOM_KEY_PREFIX', 'bloom')
+    BLOOM_BITS = int(os.getenv('BLOOM_BITS', 2 ** 23))
+    BLOOM_HASHES = int(os.getenv('BLOOM_HASHES', 7))
+    BLOOM_RELOAD_INTERVAL = float(os.getenv('BLOOM_RELOAD_INTERVAL', 60))
+    # списки лучших фильмов ведет ETL (etl/etl_redis.py)
+    TOP_KEY_PREFIX = os.getenv('TOP_KEY_PREFIX', 'top')
+    CACHE_LOCK_ENABLED = os.getenv('CACHE_LOCK_ENABLED', 'False') == 'True'
+    CACHE_LOCK_TIMEOUT = float(os.getenv('CACHE_LOCK_TIMEOUT', 5))
+    CACHE_LOCK_POLL_INTERVAL = float(os.getenv('CACHE_LOCK_POLL_INTERVAL', 0.05))
+    # карточка документа меняется редко, результаты поиска - дешевле пересчитать
+    CACHE_POLICIES = {
+        'detail': cache_policy('DETAIL', 60 * 5, 60 * 30, 60),
+        'list': cache_policy('LIST', 60, 60 * 10, 10),
+        'search': cache_policy('SEARCH', 60, 60 * 5, 10),
+    }
+    CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', 0.1))
+    CACHE_EARLY_REFRESH_BETA = float(os.getenv('CACHE_EARLY_REFRESH_BETA', 1))
+    # 0 - ответы в кеше не сжимаются
+    CACHE_COMPRESS_MIN_SIZE = int(os.getenv('CACHE_COMPRESS_MIN_SIZE', 0))
+    CACHE_COMPRESS_LEVEL = int(os.getenv('CACHE_COMPRESS_LEVEL', 6))
 
     class Config:
         env_file = '.env'
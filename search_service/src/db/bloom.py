@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+from aioredis import Redis
+from src.core.config import settings
+
+logger = logging.getLogger('root')
+
+
+def bloom_positions(item_id: str, bits: int, hashes: int) -> list[int]:
+    """
+    Номера битов id в фильтре: двойное хэширование blake2b,
+    как у ETL (etl/etl_redis.py)
+    """
+    digest = hashlib.blake2b(item_id.encode(), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'big')
+    step = int.from_bytes(digest[8:], 'big') | 1
+    return [(first + i * step) % bits for i in range(hashes)]
+
+
+class BloomFilter:
+    """
+    Фильтр Блума по битовой карте, которую ETL ведет в Redis.
+    Нумерация битов как у SETBIT: нулевой - старший бит первого байта
+    """
+
+    def __init__(self, bitmap: bytes, bits: int, hashes: int):
+        self.bits = bits
+        self.hashes = hashes
+        # хвост из нулевых байтов Redis не хранит
+        self.bitmap = bytearray(bitmap.ljust(bits // 8, b'\x00'))
+
+    def add(self, item_id: str):
+        for position in bloom_positions(item_id, self.bits, self.hashes):
+            self.bitmap[position >> 3] |= 0x80 >> (position & 7)
+
+    def __contains__(self, item_id: str) -> bool:
+        return all(
+            self.bitmap[position >> 3] & (0x80 >> (position & 7))
+            for position in bloom_positions(item_id, self.bits, self.hashes)
+        )
+
+
+class BloomFilters:
+    """
+    Фильтры Блума воркера по индексам. Без фильтра индекса
+    (ETL его еще не построил) любой документ считается возможным
+    """
+
+    def __init__(self):
+        self.filters: dict[str, BloomFilter] = {}
+
+    def might_contain(self, index: str, item_id: str) -> bool:
+        bloom = self.filters.get(index)
+        return bloom is None or item_id in bloom
+
+    def add(self, index: str, ids: list[str]):
+        bloom = self.filters.get(index)
+        if bloom is not None:
+            for item_id in ids:
+                bloom.add(item_id)
+
+    def update(self, index: str, bitmap: Optional[bytes]):
+        bits = settings.BLOOM_BITS // 8 * 8
+        if bitmap is None or len(bitmap) > bits // 8:
+            if bitmap is not None:
+                logger.warning(f'Bloom filter of {index} is larger than BLOOM_BITS, disabled')
+            self.filters.pop(index, None)
+            return
+        self.filters[index] = BloomFilter(bitmap, bits, settings.BLOOM_HASHES)
+
+
+bloom_filters = BloomFilters()
+
+
+async def reload_bloom_filters(redis_client: Redis, indexes: list[str]):
+    """
+    Загрузка фильтров из Redis раз в BLOOM_RELOAD_INTERVAL секунд.
+    Документы, записанные между загрузками, добавляются в фильтры
+    по сообщениям ETL об изменениях
+    """
+    while True:
+        try:
+            for index in indexes:
+                bloom_filters.update(
+                    index,
+                    await redis_client.get(f'{settings.BLOOM_KEY_PREFIX}::{index}')
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f'Bloom filters reload failed: {e}')
+        await asyncio.sleep(settings.BLOOM_RELOAD_INTERVAL)
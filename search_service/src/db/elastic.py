@@ -1,7 +1,85 @@
 import abc
+import base64
+import binascii
 from typing import Optional
 
+import orjson
 from elasticsearch import AsyncElasticsearch, NotFoundError
+from src.core.config import settings
+from src.services.cache_generate import normalize_text
+
+# последний ключ сортировки: одинаковые значения сортировки
+# не дают пропускать и повторять документы между страницами
+TIE_BREAKER = {"id": "asc"}
+# внутри point in time добавляется еще и _shard_doc. Курсор страницы
+# без point in time дополняется максимальным значением: документ
+# с тем же ключом уже отдан, а ключи уникальны благодаря id
+PIT_TIE_BREAKER = {"_shard_doc": "asc"}
+SHARD_DOC_MAX = 2 ** 63 - 1
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class InvalidQueryError(ValueError):
+    pass
+
+
+def parse_range(value: str) -> tuple[Optional[float], Optional[float]]:
+    """
+    Границы фильтра-диапазона <от>..<до>, любая может быть пустой.
+    Одно число - точное значение
+    """
+    bounds = value.split('..') if '..' in value else [value, value]
+    try:
+        low, high = (float(bound) if bound else None for bound in bounds)
+    except ValueError:
+        raise InvalidQueryError(f'invalid range {value}')
+    if low is None and high is None:
+        raise InvalidQueryError(f'invalid range {value}')
+    return low, high
+
+
+def parse_sort(index: str, sort: str) -> tuple[str, str]:
+    """
+    Поле индекса и направление сортировки <поле>[:asc|desc]
+    по SORT_FIELDS, по умолчанию по убыванию
+    """
+    name, _, order = sort.partition(':')
+    field = settings.SORT_FIELDS.get(index, {}).get(name)
+    if field is None or order not in ('', 'asc', 'desc'):
+        raise InvalidQueryError(f'unknown sort {sort}')
+    return field, order or 'desc'
+
+
+def check_filters(index: str, filters: dict[str, str]):
+    """
+    Проверка фильтров по FILTER_FIELDS до обращения к кешу
+    """
+    fields = settings.FILTER_FIELDS.get(index, {})
+    for name, value in filters.items():
+        if name not in fields:
+            raise InvalidQueryError(f'unknown filter {name}')
+        if fields[name].kind == 'range':
+            parse_range(value)
+
+
+def encode_cursor(pit_id: Optional[str], after: list) -> str:
+    """
+    Непрозрачный курсор следующей страницы: point in time
+    и значения сортировки последнего документа
+    """
+    data = orjson.dumps({"pit": pit_id, "after": after})
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[Optional[str], list]:
+    try:
+        data = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return data["pit"], data["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursorError(cursor)
 
 
 class AsyncDataProvider(abc.ABC):
@@ -16,23 +94,40 @@ class AsyncDataProvider(abc.ABC):
             query: str,
             page_size: int,
             page_number: int,
-    ):
+            cursor: Optional[str] = None,
+            source: Optional[list[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
         pass
 
     @abc.abstractmethod
     async def get_all(
             self,
             index: str,
-            sort: str,
-            filter_name: str,
-            filter_arg: str,
+            sort: Optional[str],
+            filters: dict[str, str],
             page_size: int,
             page_number: int,
-    ):
+            cursor: Optional[str] = None,
+            source: Optional[list[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        pass
+
+    @abc.abstractmethod
+    async def get_by_id(
+            self,
+            index: str,
+            id: str,
+            source: Optional[list[str]] = None,
+    ) -> Optional[dict]:
         pass
 
     @abc.abstractmethod
-    async def get_by_id(self, index: str, id: str) -> Optional[dict]:
+    async def get_by_ids(
+            self,
+            index: str,
+            ids: list[str],
+            source: Optional[list[str]] = None,
+    ) -> dict[str, dict]:
         pass
 
 
@@ -46,61 +141,112 @@ class AsyncElasticProvider(AsyncDataProvider):
             query: str,
             page_size: int,
             page_number: int,
-    ) -> list[dict]:
+            cursor: Optional[str] = None,
+            source: Optional[list[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
         """
-        Поиск результата по запросу
+        Поиск результата по запросу в полях из SEARCH_PROFILES.
+        Запрос уходит в том же нормализованном виде, что и в ключ кеша.
+        Точное совпадение с exact-полем профиля - keyword с тем же
+        нормализатором, что и анализатор ru, - поднимается наверх
+        тем же запросом. source - поля документов в ответе
         """
-        body = {
-            "query": {
-                "multi_match": {
-                    "query": query,
-                    "fuzziness": "auto",
-                    "analyzer": "ru"
-                }
-            }
+        profile = settings.SEARCH_PROFILES.get(index)
+        query = normalize_text(query)
+        match = {
+            "query": query,
+            "fuzziness": "auto",
+            "prefix_length": settings.SEARCH_FUZZY_PREFIX_LENGTH,
+            "max_expansions": settings.SEARCH_FUZZY_MAX_EXPANSIONS,
         }
-        return await self._search(index, body, page_size, page_number)
+        if profile:
+            match["fields"] = profile.fields
+        body = {"query": {"multi_match": match}}
+        if profile and profile.exact:
+            body["query"] = {"bool": {"should": [
+                {"term": {profile.exact: {"value": query, "boost": 10}}},
+                {"multi_match": match},
+            ]}}
+        body["sort"] = ["_score", TIE_BREAKER]
+        if source is not None:
+            body["_source"] = source
+        return await self._search(index, body, page_size, page_number, cursor)
 
     async def get_by_id(
             self,
             index: str,
             id: str,
+            source: Optional[list[str]] = None,
     ) -> Optional[dict]:
         """
         Здесь мы получаем информацию только о одном элементе по айди из эластики.
+        source - поля документа в ответе, без него документ целиком
         """
         try:
-            doc = await self.elastic.get(index, id)
+            doc = await self.elastic.get(index, id, _source_includes=source)
         except NotFoundError:
             return None
         return doc['_source']
 
+    async def get_by_ids(
+            self,
+            index: str,
+            ids: list[str],
+            source: Optional[list[str]] = None,
+    ) -> dict[str, dict]:
+        """
+        Несколько документов по id одним запросом mget.
+        Ненайденных id в ответе нет
+        """
+        if not ids:
+            return {}
+        response = await self.elastic.mget(body={"ids": ids}, index=index, _source_includes=source)
+        return {doc["_id"]: doc["_source"] for doc in response["docs"] if doc.get("found")}
+
     async def get_all(
             self,
             index: str,
-            sort: str,
-            filter_name: str,
-            filter_arg: str,
+            sort: Optional[str],
+            filters: dict[str, str],
             page_size: int,
             page_number: int,
-    ):
+            cursor: Optional[str] = None,
+            source: Optional[list[str]] = None,
+    ) -> tuple[list[dict], Optional[str]]:
         """
         Здесь мы получаем информацию только о нескольких элементах из эластики.
+        filters - {имя из FILTER_FIELDS: значение}, фильтры не влияют
+        на релевантность и кешируются эластикой. sort - <поле>[:asc|desc]
+        из SORT_FIELDS. source - поля документов в ответе
         """
+        body = {"query": {"match_all": {}}, "sort": [TIE_BREAKER]}
 
-        body = {"query": {"bool": {"must": {"match_all": {}}}}}
+        if filters:
+            body["query"] = {"bool": {"filter": [
+                self._filter(index, name, value) for name, value in sorted(filters.items())
+            ]}}
 
         if sort:
-            body["sort"] = [{f"{sort}": "desc"}, "_score"]
+            field, order = parse_sort(index, sort)
+            body["sort"] = [{field: order}, TIE_BREAKER]
+
+        if source is not None:
+            body["_source"] = source
 
-        if filter_name and filter_arg:
-            body["query"]["bool"]["filter"] = {
-                "match": {
-                    f"{filter_name}": f"{filter_arg}"
-                }
-            }
+        return await self._search(index, body, page_size, page_number, cursor)
 
-        return await self._search(index, body, page_size, page_number)
+    @staticmethod
+    def _filter(index: str, name: str, value: str) -> dict:
+        filter_field = settings.FILTER_FIELDS[index][name]
+        if filter_field.kind == 'term':
+            return {"term": {filter_field.field: value}}
+        if filter_field.kind == 'range':
+            low, high = parse_range(value)
+            bounds = {"gte": low, "lte": high}
+            return {"range": {filter_field.field: {
+                bound: limit for bound, limit in bounds.items() if limit is not None
+            }}}
+        return {"match": {filter_field.field: {"query": normalize_text(value), "operator": "and"}}}
 
     async def _search(
             self,
@@ -108,18 +254,82 @@ class AsyncElasticProvider(AsyncDataProvider):
             body: dict,
             page_size: int,
             page_number: int,
-    ) -> list[dict]:
+            cursor: Optional[str] = None,
+    ) -> tuple[list[dict], Optional[str]]:
         """
         Вспомогательное решение для поиска. Поскольку используется дважды.
+        Без курсора страница выбирается через from/size, с курсором -
+        через search_after в point in time, и стоимость страницы
+        не зависит от ее номера. Возвращает документы и курсор
+        следующей страницы
         """
+        if cursor is None:
+            response = await self.elastic.search(
+                index=index,
+                body=body,
+                from_=(page_number - 1) * page_size,
+                size=page_size,
+            )
+            return self._page(response, page_size, None)
 
-        response = await self.elastic.search(
-            index=index,
-            body=body,
-            from_=(page_number - 1) * page_size,
-            size=page_size,
-        )
-        return [d["_source"] for d in response["hits"]["hits"]]
+        pit_id, after = decode_cursor(cursor)
+        if len(after) == len(body["sort"]):
+            after = after + [SHARD_DOC_MAX]
+        body["sort"] = body["sort"] + [PIT_TIE_BREAKER]
+        if len(after) != len(body["sort"]):
+            raise InvalidCursorError(cursor)
+        body["search_after"] = after
+        try:
+            response = await self._search_pit(index, body, page_size, pit_id)
+        except NotFoundError:
+            # point in time истек, продолжаем в новом
+            response = await self._search_pit(index, body, page_size, None)
+        hits, next_cursor = self._page(response, page_size, response.get("pit_id"))
+        if next_cursor is None:
+            await self._close_pit(response.get("pit_id"))
+        return hits, next_cursor
+
+    async def _search_pit(
+            self,
+            index: str,
+            body: dict,
+            page_size: int,
+            pit_id: Optional[str],
+    ) -> dict:
+        if pit_id is None:
+            pit = await self.elastic.transport.perform_request(
+                "POST",
+                f"/{index}/_pit",
+                params={"keep_alive": settings.ELASTIC_PIT_KEEP_ALIVE},
+            )
+            pit_id = pit["id"]
+        body = {
+            **body,
+            "pit": {"id": pit_id, "keep_alive": settings.ELASTIC_PIT_KEEP_ALIVE},
+        }
+        return await self.elastic.search(body=body, size=page_size)
+
+    async def _close_pit(self, pit_id: Optional[str]):
+        if pit_id is None:
+            return
+        try:
+            await self.elastic.transport.perform_request(
+                "DELETE", "/_pit", body={"id": pit_id}
+            )
+        except NotFoundError:
+            pass
+
+    @staticmethod
+    def _page(
+            response: dict,
+            page_size: int,
+            pit_id: Optional[str],
+    ) -> tuple[list[dict], Optional[str]]:
+        hits = response["hits"]["hits"]
+        next_cursor = None
+        if len(hits) == page_size:
+            next_cursor = encode_cursor(pit_id, hits[-1]["sort"])
+        return [d["_source"] for d in hits], next_cursor
 
 
 es: Optional[AsyncDataProvider] = None
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Optional
+
+import orjson
+from aioredis import Redis
+from src.core.config import settings
+from src.db.bloom import bloom_filters
+from src.db.redis import AsyncCacheStorage
+from src.services.cache_generate import generations, load_generations
+
+logger = logging.getLogger('root')
+
+
+class LocalCache:
+    """
+    Ограниченный по размеру LRU-кеш воркера с временем жизни записей.
+    Хранит сырые значения из Redis вместе с моментом их истечения
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expire_at, value = entry
+        if expire_at < monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self.data[key] = (monotonic() + self.ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def delete(self, keys: list[str]):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def invalidate(
+            self,
+            index: Optional[str] = None,
+            ids: Optional[list] = None,
+            keys: Optional[list] = None
+    ):
+        """
+        Удаление записей keys, снятых ETL по тегам документов ids
+        индекса index. Без ids и keys кеш очищается целиком
+        """
+        if ids is None and keys is None:
+            self.data.clear()
+            return
+        self.delete(keys or [])
+
+
+class TwoTierCacheProvider(AsyncCacheStorage):
+    """
+    Двухуровневый кеш: локальный кеш воркера перед общим кешем в Redis.
+    При промахе локального кеша значение читается из Redis
+    и запоминается локально вместе с моментом истечения записи в Redis
+    """
+
+    def __init__(self, cache: AsyncCacheStorage, local_cache: LocalCache):
+        self.cache = cache
+        self.local_cache = local_cache
+
+    async def get(self, key: str, **kwargs) -> Optional[bytes]:
+        value, _ = await self.get_with_ttl(key=key, **kwargs)
+        return value
+
+    async def get_with_ttl(
+            self,
+            key: str,
+            **kwargs
+    ) -> tuple[Optional[bytes], Optional[float]]:
+        entry = self.local_cache.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= monotonic():
+            entry = None
+        if entry is None:
+            data, ttl = await self.cache.get_with_ttl(key=key, **kwargs)
+            if data is None:
+                return None, None
+            entry = (data, self._deadline(ttl))
+            self.local_cache.set(key, entry)
+        value, deadline = entry
+        return value, deadline - monotonic() if deadline is not None else None
+
+    async def set(
+            self,
+            key: str,
+            value: str,
+            expire: Optional[float] = None,
+            **kwargs
+    ):
+        await self.cache.set(key=key, value=value, expire=expire, **kwargs)
+        self.local_cache.set(key, (value, self._deadline(expire)))
+
+    async def mget(self, keys: list[str], **kwargs) -> list[Optional[bytes]]:
+        values = {}
+        for key in keys:
+            entry = self.local_cache.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > monotonic()):
+                values[key] = entry[0]
+        missing = [key for key in dict.fromkeys(keys) if key not in values]
+        for key, data in zip(missing, await self.cache.mget(missing, **kwargs)):
+            if data is None:
+                continue
+            values[key] = data
+            # время жизни в Redis MGET не возвращает
+            self.local_cache.set(key, (values[key], None))
+        return [values.get(key) for key in keys]
+
+    async def delete_many(self, keys: list[str]):
+        await self.cache.delete_many(keys)
+        self.local_cache.delete(keys)
+
+    async def execute(self, commands: list[tuple[str, tuple, dict]]):
+        """
+        Команды уходят в Redis одним пайплайном,
+        локальный кеш обновляется после их выполнения
+        """
+        await self.cache.execute(commands)
+        for command, args, kwargs in commands:
+            if command == 'set':
+                key, value = args
+                self.local_cache.set(key, (value, self._deadline(kwargs.get('expire'))))
+            elif command == 'delete':
+                self.local_cache.delete(list(args))
+
+    @staticmethod
+    def _deadline(ttl: Optional[float]) -> Optional[float]:
+        """
+        Момент истечения записи в Redis, чтобы локальная копия
+        знала, когда запись устаревает
+        """
+        return monotonic() + ttl if ttl is not None else None
+
+    async def get_ranked(
+            self,
+            key: str,
+            docs_key: str,
+            start: int,
+            stop: int
+    ) -> Optional[list[Optional[bytes]]]:
+        # списки заменяет ETL без сообщений об изменениях, читаем из Redis
+        return await self.cache.get_ranked(key, docs_key, start, stop)
+
+    async def lock(self, key: str, timeout: float) -> Optional[str]:
+        return await self.cache.lock(key, timeout)
+
+    async def unlock(self, key: str, token: str):
+        await self.cache.unlock(key, token)
+
+    async def tag(self, key: str, tags: list[str], expire: float):
+        await self.cache.tag(key, tags, expire)
+
+
+async def listen_invalidation(redis_client: Redis, local_cache: LocalCache, indexes: list[str]):
+    """
+    Подписка на сообщения ETL об измененных документах
+    {"index": индекс, "ids": [id], "keys": [ключи, снятые по тегам],
+    "generation": новое поколение списков или null}.
+    Записанные документы добавляются в фильтры Блума воркера.
+    При обрыве подписки локальный кеш очищается, а поколения
+    перечитываются: сообщения могли потеряться
+    """
+    while True:
+        try:
+            channel, = await redis_client.subscribe(settings.CACHE_INVALIDATE_CHANNEL)
+            await load_generations(redis_client, indexes)
+            async for message in channel.iter():
+                try:
+                    data = orjson.loads(message)
+                    local_cache.invalidate(data['index'], data['ids'], data['keys'])
+                    generations.update(data['index'], data.get('generation'))
+                    bloom_filters.add(data['index'], data['ids'] or [])
+                except (ValueError, TypeError, KeyError):
+                    logger.warning(f'Unexpected invalidation message {message}')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f'Cache invalidation subscription failed: {e}')
+        local_cache.invalidate()
+        await asyncio.sleep(1)
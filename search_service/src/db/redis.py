@@ -1,9 +1,59 @@
+import uuid
 from abc import ABC, abstractmethod
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
 
 from aioredis import Redis
 from src.core.config import settings
 
+LOCK_SUFFIX = '::lock'
+
+# снимаем только свою блокировку: чужая могла появиться после истечения нашей
+UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# страница ZSET KEYS[1] по убыванию score с исходниками из HASH KEYS[2].
+# false - списка нет
+RANKED_PAGE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return false
+end
+local ids = redis.call('zrevrange', KEYS[1], ARGV[1], ARGV[2])
+if #ids == 0 then
+    return {}
+end
+return redis.call('hmget', KEYS[2], unpack(ids))
+"""
+
+
+class CachePipeline:
+    """
+    Буфер записей в кеш. Команды копятся в commands
+    и отправляются хранилищу одним запросом при выходе
+    из контекста AsyncCacheStorage.pipeline()
+    """
+
+    def __init__(self):
+        self.commands: list[tuple[str, tuple, dict]] = []
+
+    def set(self, key: str, value: Any, **kwargs):
+        self.commands.append(('set', (key, value), kwargs))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.commands.append(('delete', keys, {}))
+
+    def unlock(self, key: str, token: str):
+        self.commands.append(('unlock', (key, token), {}))
+
+    def tag(self, key: str, tags: list[str], expire: float):
+        if tags:
+            self.commands.append(('tag', (key, tags), {'expire': expire}))
+
 
 class AsyncCacheStorage(ABC):
     @abstractmethod
@@ -14,21 +64,194 @@ class AsyncCacheStorage(ABC):
     async def set(self, key: str, value: str, **kwargs):
         pass
 
+    @abstractmethod
+    async def delete_many(self, keys: list[str]):
+        pass
+
+    async def get_with_ttl(self, key: str, **kwargs) -> tuple[Optional[Any], Optional[float]]:
+        """
+        Значение и оставшееся время жизни ключа в секундах.
+        None вместо времени - хранилище его не знает
+        """
+        return await self.get(key=key, **kwargs), None
+
+    async def mget(self, keys: list[str], **kwargs) -> list[Optional[Any]]:
+        """
+        Значения нескольких ключей в порядке keys
+        """
+        return [await self.get(key=key, **kwargs) for key in keys]
+
+    async def mset(
+            self,
+            values: dict[str, Any],
+            expire: Optional[dict[str, float]] = None,
+            **kwargs
+    ):
+        """
+        Запись нескольких ключей. expire - время жизни по ключам
+        """
+        async with self.pipeline() as pipeline:
+            for key, value in values.items():
+                pipeline.set(key, value, expire=(expire or {}).get(key), **kwargs)
+
+    @asynccontextmanager
+    async def pipeline(self) -> AsyncIterator[CachePipeline]:
+        """
+        Контекст для нескольких записей за один запрос к хранилищу.
+        Команды отправляются при выходе из контекста,
+        при исключении внутри него не отправляются
+        """
+        pipeline = CachePipeline()
+        yield pipeline
+        if pipeline.commands:
+            await self.execute(pipeline.commands)
+
+    async def execute(self, commands: list[tuple[str, tuple, dict]]):
+        """
+        Выполнение команд CachePipeline. По умолчанию по одной
+        """
+        for command, args, kwargs in commands:
+            if command == 'set':
+                key, value = args
+                await self.set(key=key, value=value, **kwargs)
+            elif command == 'delete':
+                await self.delete_many(list(args))
+            elif command == 'unlock':
+                await self.unlock(*args)
+            elif command == 'tag':
+                await self.tag(*args, **kwargs)
+
+    async def get_ranked(
+            self,
+            key: str,
+            docs_key: str,
+            start: int,
+            stop: int
+    ) -> Optional[list[Optional[bytes]]]:
+        """
+        Документы с позициями start..stop списка key, отсортированного
+        по убыванию, из docs_key. None - списка нет или хранилище
+        списков не ведет
+        """
+        return None
+
+    async def lock(self, key: str, timeout: float) -> Optional[str]:
+        """
+        Блокировка заполнения ключа между воркерами.
+        Возвращает токен блокировки или None, если она занята
+        """
+        return key
+
+    async def unlock(self, key: str, token: str):
+        pass
+
+    async def tag(self, key: str, tags: list[str], expire: float):
+        """
+        Регистрация ключа в наборах тегов, по которым ETL
+        удаляет записи с измененными документами.
+        expire - время жизни наборов
+        """
+        pass
+
 
 class RedisCacheProvider(AsyncCacheStorage):
     def __init__(self, redis_client: Redis):
         self.redis_client = redis_client
 
-    async def get(self, key: str) -> Optional[dict]:
+    async def get(self, key: str, **kwargs) -> Optional[bytes]:
         data = await self.redis_client.get(key=key)
         if not data:
             return None
         return data
 
-    async def set(self, key: str, value: str):
-        await self.redis_client.set(key=key,
-                                    value=value,
-                                    expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)
+    async def get_with_ttl(
+            self,
+            key: str,
+            **kwargs
+    ) -> tuple[Optional[bytes], Optional[float]]:
+        transaction = self.redis_client.multi_exec()
+        transaction.get(key)
+        transaction.pttl(key)
+        data, pttl = await transaction.execute()
+        if not data:
+            return None, None
+        return data, pttl / 1000 if pttl > 0 else None
+
+    async def set(self, key: str, value: str, expire: Optional[float] = None, **kwargs):
+        await self.redis_client.set(key=key, value=value, pexpire=self._pexpire(expire))
+
+    async def delete_many(self, keys: list[str]):
+        if keys:
+            await self.redis_client.delete(*keys)
+
+    async def mget(self, keys: list[str], **kwargs) -> list[Optional[bytes]]:
+        if not keys:
+            return []
+        values = await self.redis_client.mget(*keys)
+        return [value or None for value in values]
+
+    async def execute(self, commands: list[tuple[str, tuple, dict]]):
+        """
+        Все команды CachePipeline одним пайплайном Redis
+        """
+        pipeline = self.redis_client.pipeline()
+        for command, args, kwargs in commands:
+            if command == 'set':
+                key, value = args
+                pipeline.set(key, value, pexpire=self._pexpire(kwargs.get('expire')))
+            elif command == 'delete':
+                pipeline.delete(*args)
+            elif command == 'unlock':
+                key, token = args
+                pipeline.eval(UNLOCK_SCRIPT, keys=[f'{key}{LOCK_SUFFIX}'], args=[token])
+            elif command == 'tag':
+                key, tags = args
+                for tag in tags:
+                    pipeline.sadd(tag, key)
+                    pipeline.pexpire(tag, self._pexpire(kwargs['expire']))
+        await pipeline.execute()
+
+    async def tag(self, key: str, tags: list[str], expire: float):
+        async with self.pipeline() as pipeline:
+            pipeline.tag(key, tags, expire)
+
+    async def get_ranked(
+            self,
+            key: str,
+            docs_key: str,
+            start: int,
+            stop: int
+    ) -> Optional[list[Optional[bytes]]]:
+        """
+        ZREVRANGE и HMGET исходников одним скриптом:
+        O(log n + m) и список не меняется между ними
+        """
+        return await self.redis_client.eval(
+            RANKED_PAGE_SCRIPT,
+            keys=[key, docs_key],
+            args=[start, stop]
+        )
+
+    @staticmethod
+    def _pexpire(expire: Optional[float]) -> int:
+        return int((expire or settings.FILM_CACHE_EXPIRE_IN_SECONDS) * 1000)
+
+    async def lock(self, key: str, timeout: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        locked = await self.redis_client.set(
+            key=f'{key}{LOCK_SUFFIX}',
+            value=token,
+            pexpire=int(timeout * 1000),
+            exist=Redis.SET_IF_NOT_EXIST
+        )
+        return token if locked else None
+
+    async def unlock(self, key: str, token: str):
+        await self.redis_client.eval(
+            UNLOCK_SCRIPT,
+            keys=[f'{key}{LOCK_SUFFIX}'],
+            args=[token]
+        )
 
 
 redis: Optional[AsyncCacheStorage] = None
@@ -1,13 +1,24 @@
+import asyncio
 import logging
+from http import HTTPStatus
 
 import aioredis
 from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.responses import ORJSONResponse
 from src.api.v1 import films, genres, persons
 from src.core.config import settings
 from src.db import elastic, redis
+from src.db.bloom import reload_bloom_filters
+from src.db.elastic import InvalidCursorError, InvalidQueryError
+from src.db.local_cache import (LocalCache, TwoTierCacheProvider,
+                                listen_invalidation)
 from src.middlewares.auth import AuthMiddleware
+from src.services.cache_generate import load_generations
+from src.services.cache_stats import flush_cache_stats
+from src.services.film import FilmService
+from src.services.genre import GenreService
+from src.services.person import PersonService
 from starlette.middleware.base import BaseHTTPMiddleware
 
 logger = logging.getLogger('root')
@@ -25,17 +36,44 @@ async def startup():
         (settings.REDIS_HOST, settings.REDIS_PORT),
         minsize=10, maxsize=20
     )
-    redis.redis = redis.RedisCacheProvider(redis_client)
+    local_cache = LocalCache(
+        maxsize=settings.LOCAL_CACHE_SIZE,
+        ttl=settings.LOCAL_CACHE_EXPIRE_IN_SECONDS
+    )
+    redis.redis = TwoTierCacheProvider(redis.RedisCacheProvider(redis_client), local_cache)
+    app.state.redis_client = redis_client
+    indexes = [FilmService.index, GenreService.index, PersonService.index]
+    await load_generations(redis_client, indexes)
+    app.state.invalidation = asyncio.create_task(
+        listen_invalidation(redis_client, local_cache, indexes)
+    )
+    app.state.cache_stats = asyncio.create_task(flush_cache_stats(redis_client))
+    app.state.bloom_filters = asyncio.create_task(reload_bloom_filters(redis_client, indexes))
     elastic_client = AsyncElasticsearch(
         hosts=[f"{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}"]
     )
     elastic.es = elastic.AsyncElasticProvider(elastic_client)
 
 
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor(request: Request, exc: InvalidCursorError):
+    return ORJSONResponse(status_code=HTTPStatus.BAD_REQUEST,
+                          content={'detail': 'invalid page[cursor]'})
+
+
+@app.exception_handler(InvalidQueryError)
+async def invalid_query(request: Request, exc: InvalidQueryError):
+    return ORJSONResponse(status_code=HTTPStatus.BAD_REQUEST,
+                          content={'detail': str(exc)})
+
+
 @app.on_event('shutdown')
 async def shutdown():
-    redis.redis.close()
-    await redis.redis.wait_closed()
+    app.state.invalidation.cancel()
+    app.state.cache_stats.cancel()
+    app.state.bloom_filters.cancel()
+    app.state.redis_client.close()
+    await app.state.redis_client.wait_closed()
     await elastic.es.close()
 
 
@@ -23,10 +23,6 @@ class Base(BaseModel):
         json_dumps = orjson_dumps
 
 
-class ListCache(BaseModel):
-    __root__: list[str]
-
-
 class Film(Base):
     id: uuid.UUID
     title: str
@@ -0,0 +1,330 @@
+import asyncio
+import gzip
+import logging
+import math
+import random
+from time import monotonic
+from typing import Awaitable, Callable, Optional, Type
+
+import orjson
+from src.core.config import CachePolicy, settings
+from src.db.bloom import bloom_filters
+from src.db.elastic import AsyncDataProvider, check_filters, parse_sort
+from src.db.redis import AsyncCacheStorage
+from src.models.data_models import Base
+from src.services.cache_generate import CacheKey, CacheObj, normalize_text
+from src.services.cache_stats import cache_stats
+from src.services.single_flight import single_flight
+
+logger = logging.getLogger('root')
+
+GZIP_MAGIC = b'\x1f\x8b'
+# запись кеша о том, что документа нет или страница пуста
+NOT_FOUND = b'\x00'
+
+# тело ответа для кеша (None - результата нет) и теги записи
+Loaded = Optional[tuple[Optional[bytes], list[str]]]
+
+# фоновые обновления кеша: ссылки держим, чтобы задачи не собрал gc
+refresh_tasks: set[asyncio.Task] = set()
+
+
+class BaseService(CacheKey):
+    """
+    Общая логика сервисов: сначала кеш, потом эластика.
+    model - модель документа по id, list_model - модель элемента списков.
+    В кеше хранится готовое тело ответа в orjson, поэтому попадание
+    в кеш обходится без построения моделей
+    """
+    index: str
+    model: Type[Base]
+    list_model: Type[Base]
+
+    def __init__(self, redis: AsyncCacheStorage, elastic: AsyncDataProvider):
+        self.redis = redis
+        self.elastic = elastic
+        # среднее время запроса к эластике по видам запросов
+        self.load_time: dict[str, float] = {}
+
+    async def _get_by_id(self, item_id: str) -> Optional[bytes]:
+        """
+        Тело ответа с одним документом по id.
+        id, которых нет в фильтре Блума индекса, отклоняются без запросов
+        """
+        if not bloom_filters.might_contain(self.index, item_id):
+            return None
+        source = self._projection(self.model)
+
+        async def load():
+            data = await self.elastic.get_by_id(index=self.index, id=item_id, source=source)
+            # отсутствие документа снимет ETL, когда документ появится
+            if not data:
+                return None, [self._tag(item_id)]
+            return self._dump(self.model(**data).dict()), [self._tag(item_id)]
+
+        return await self._cached(self._detail_key(item_id, source), load, 'detail')
+
+    async def _get_many(self, ids: list[str]) -> bytes:
+        """
+        Тело ответа с документами по списку id в порядке запроса,
+        null на месте ненайденных. id не из фильтра Блума пропускаются,
+        кеш читается одним MGET, промахи - одним mget к эластике,
+        найденное и ненайденное дописывается в кеш одним пайплайном
+        """
+        source = self._projection(self.model)
+        keys = {
+            item_id: self._detail_key(item_id, source)
+            for item_id in ids
+            if bloom_filters.might_contain(self.index, item_id)
+        }
+        cached = dict(zip(keys, await self.redis.mget(list(keys.values()))))
+        missing = [item_id for item_id, value in cached.items() if value is None]
+        cache_stats.hit(self._family('detail'), len(cached) - len(missing))
+        cache_stats.miss(self._family('detail'), len(missing))
+        if missing:
+            loaded = {
+                item_id: self._dump(self.model(**data).dict())
+                for item_id, data in (await self.elastic.get_by_ids(self.index, missing, source)).items()
+            }
+            cache_policy = settings.CACHE_POLICIES['detail']
+            async with self.redis.pipeline() as pipeline:
+                for item_id in missing:
+                    if item_id in loaded:
+                        pipeline.set(keys[item_id], loaded[item_id], expire=self._expire(cache_policy))
+                    else:
+                        loaded[item_id] = NOT_FOUND
+                        pipeline.set(keys[item_id], NOT_FOUND, expire=settings.CACHE_NEGATIVE_TTL)
+                    pipeline.tag(keys[item_id], [self._tag(item_id)], expire=self._tag_expire())
+            cached.update(loaded)
+        values = [
+            self._load_body(cached[item_id]) if cached.get(item_id) not in (None, NOT_FOUND) else b'null'
+            for item_id in ids
+        ]
+        return b'{"values":[' + b','.join(values) + b']}'
+
+    def _check_query(self, filters: dict[str, str], sort: Optional[str]) -> str:
+        """
+        Проверка фильтров и сортировки списка до обращения к кешу,
+        неизвестные поля - InvalidQueryError. Возвращает фильтры
+        для ключа кеша в порядке имен. Значения полнотекстовых
+        фильтров нормализуются, как и запрос поиска
+        """
+        check_filters(self.index, filters)
+        if sort:
+            parse_sort(self.index, sort)
+        fields = settings.FILTER_FIELDS.get(self.index, {})
+        return '&'.join(
+            f'{name}={normalize_text(value) if fields[name].kind == "match" else value}'
+            for name, value in sorted(filters.items())
+        )
+
+    @staticmethod
+    def _projection(model: Type[Base]) -> list[str]:
+        """
+        Поля документа, которые нужны модели ответа.
+        Только они запрашиваются у эластики и входят в ключ кеша
+        """
+        return list(model.__fields__)
+
+    def _detail_key(self, item_id: str, source: list[str]) -> str:
+        """
+        Ключ записи с одним документом в проекции source.
+        Записи документа снимаются ETL по тегу его id
+        """
+        return self._create_cache_key(
+            [
+                CacheObj(key_name='id', key_value=item_id),
+                CacheObj(key_name='fields', key_value=','.join(source))
+            ],
+            family='detail'
+        )
+
+    @staticmethod
+    def _load_body(body: bytes) -> bytes:
+        """
+        Тело из кеша для вставки в составной ответ
+        """
+        return gzip.decompress(body) if body.startswith(GZIP_MAGIC) else body
+
+    async def _get_list(
+            self,
+            key: str,
+            search: Callable[[], Awaitable[tuple[list[dict], Optional[str]]]],
+            page_size: int,
+            page_number: int,
+            policy: str = 'list',
+            cursor: Optional[str] = None
+    ) -> Optional[bytes]:
+        """
+        Тело ответа со страницей документов по ключу кеша.
+        search - запрос к эластике при промахе кеша,
+        policy - имя политики времени жизни из CACHE_POLICIES.
+        Страницы не помечаются тегами: любое изменение документов,
+        которое может их изменить, уводит списки в новое поколение ключей.
+        Страницы по курсору не кешируются: курсор ссылается
+        на point in time конкретного клиента
+        """
+        async def load():
+            docs, next_cursor = await search()
+            items = [self.list_model(**d).dict() for d in docs]
+            if not items:
+                # пустую страницу заполнит новый документ индекса,
+                # а с ним сменится поколение ключей
+                return None, []
+            body = self._dump({
+                'page_size': page_size,
+                'page_number': None if cursor else page_number,
+                'next_cursor': next_cursor,
+                'values': items
+            })
+            return body, []
+
+        if cursor:
+            return (await load())[0]
+        return await self._cached(key, load, policy)
+
+    @staticmethod
+    def _dump(body: dict) -> bytes:
+        """
+        Сериализация ответа для кеша. Ответы от CACHE_COMPRESS_MIN_SIZE
+        байт сжимаются gzip
+        """
+        data = orjson.dumps(body)
+        if settings.CACHE_COMPRESS_MIN_SIZE and len(data) >= settings.CACHE_COMPRESS_MIN_SIZE:
+            data = gzip.compress(data, compresslevel=settings.CACHE_COMPRESS_LEVEL)
+        return data
+
+    def _tag(self, item_id: str) -> str:
+        """
+        Тег записей кеша с документом item_id.
+        Формат общий с ETL: <CACHE_TAG_PREFIX>::<индекс>::<id>
+        """
+        return self._separator.join((settings.CACHE_TAG_PREFIX, self.index, item_id))
+
+    async def _cached(
+            self,
+            key: str,
+            load: Callable[[], Awaitable[Loaded]],
+            policy: str
+    ) -> Optional[bytes]:
+        """
+        Чтение из кеша. Одинаковые промахи воркера ждут один запрос
+        к эластике. load возвращает тело ответа для кеша и его теги.
+        Устаревшая запись отдается сразу и обновляется в фоне,
+        запись NOT_FOUND - None без обращения к эластике
+        """
+        flight_key = f'{self.index}{self._separator}{key}'
+        value, ttl = await self.redis.get_with_ttl(key=key)
+        if value is not None:
+            cache_stats.hit(self._family(policy))
+            if value == NOT_FOUND:
+                return None
+            if ttl is not None and self._should_refresh(ttl, policy) \
+                    and flight_key not in single_flight.calls:
+                task = asyncio.ensure_future(single_flight.do(
+                    flight_key,
+                    lambda: self._fill(key, load, policy, refresh=True)
+                ))
+                refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_done)
+            return value
+        cache_stats.miss(self._family(policy))
+        return await single_flight.do(
+            flight_key,
+            lambda: self._fill(key, load, policy)
+        )
+
+    def _family(self, policy: str) -> str:
+        """
+        Семейство ключей для счетчиков попаданий: индекс и политика
+        """
+        return f'{self.index}:{policy}'
+
+    def _should_refresh(self, ttl: float, policy: str) -> bool:
+        """
+        Пора ли обновить запись, которой осталось жить ttl секунд.
+        После soft_ttl - всегда, до него - с вероятностью, растущей
+        к моменту устаревания и со временем запроса к эластике
+        (probabilistic early expiration), чтобы ключи обновлялись вразброс
+        """
+        cache_policy = settings.CACHE_POLICIES[policy]
+        fresh_for = ttl - (cache_policy.hard_ttl - cache_policy.soft_ttl)
+        if fresh_for <= 0:
+            return True
+        delta = self.load_time.get(policy, 0.0)
+        return -delta * settings.CACHE_EARLY_REFRESH_BETA * math.log(1 - random.random()) >= fresh_for
+
+    @staticmethod
+    def _refresh_done(task: asyncio.Task):
+        refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f'Cache refresh failed: {task.exception()}')
+
+    @staticmethod
+    def _expire(cache_policy: CachePolicy) -> float:
+        """
+        Время жизни записи в Redis: soft_ttl со случайным разбросом,
+        чтобы одновременно записанные ключи устаревали и истекали
+        вразброс, плюс окно устаревшей записи hard_ttl - soft_ttl.
+        Окно не меняется, поэтому _should_refresh по оставшемуся
+        времени жизни видит свежую запись ровно soft_ttl с разбросом
+        """
+        jitter = settings.CACHE_TTL_JITTER
+        stale_for = cache_policy.hard_ttl - cache_policy.soft_ttl
+        return cache_policy.soft_ttl * random.uniform(1 - jitter, 1 + jitter) + stale_for
+
+    @staticmethod
+    def _tag_expire() -> float:
+        return max(
+            cache_policy.hard_ttl for cache_policy in settings.CACHE_POLICIES.values()
+        ) * (1 + settings.CACHE_TTL_JITTER)
+
+    async def _fill(
+            self,
+            key: str,
+            load: Callable[[], Awaitable[Loaded]],
+            policy: str,
+            refresh: bool = False
+    ) -> Optional[bytes]:
+        """
+        Заполнение кеша из эластики. С CACHE_LOCK_ENABLED ключ заполняет
+        только воркер, взявший блокировку в Redis, остальные ждут
+        появления значения в кеше или снятия блокировки
+        до CACHE_LOCK_TIMEOUT секунд. Фоновое обновление при занятой
+        блокировке пропускается: ключ уже обновляет другой воркер
+        """
+        token = None
+        if settings.CACHE_LOCK_ENABLED:
+            deadline = monotonic() + settings.CACHE_LOCK_TIMEOUT
+            token = await self.redis.lock(key, settings.CACHE_LOCK_TIMEOUT)
+            if token is None and refresh:
+                return None
+            while token is None and monotonic() < deadline:
+                await asyncio.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+                value = await self.redis.get(key=key)
+                if value is not None:
+                    return None if value == NOT_FOUND else value
+                # блокировка снята без значения: документа нет, пробуем сами
+                token = await self.redis.lock(key, settings.CACHE_LOCK_TIMEOUT)
+        try:
+            load_start = monotonic()
+            loaded = await load()
+        except BaseException:
+            if token is not None:
+                await self.redis.unlock(key, token)
+            raise
+        load_time = monotonic() - load_start
+        self.load_time[policy] = 0.8 * self.load_time.get(policy, load_time) + 0.2 * load_time
+        value, tags = loaded or (None, [])
+        # значение, теги и снятие блокировки - один запрос к Redis
+        async with self.redis.pipeline() as pipeline:
+            if value is not None:
+                pipeline.set(key, value, expire=self._expire(settings.CACHE_POLICIES[policy]))
+            else:
+                # повторы запросов без результата не идут в эластику
+                pipeline.set(key, NOT_FOUND, expire=settings.CACHE_NEGATIVE_TTL)
+            # набор тегов живет не меньше самой долгой записи в нем
+            pipeline.tag(key, tags, expire=self._tag_expire())
+            if token is not None:
+                pipeline.unlock(key, token)
+        return value
@@ -1,4 +1,14 @@
+import hashlib
+from typing import Optional
+
+from aioredis import Redis
 from pydantic import BaseModel
+from src.core.config import settings
+
+KEY_DIGEST_SIZE = 16
+
+# замены char_filter анализатора ru из etl/index.py
+E_FOLDING = str.maketrans({'ё': 'е', 'э': 'е'})
 
 
 class CacheObj(BaseModel):
@@ -6,13 +16,69 @@ class CacheObj(BaseModel):
     key_value: str
 
 
+def normalize_text(value: str) -> str:
+    """
+    Текст запроса в том виде, в каком его видит анализатор ru:
+    нижний регистр, ё и э как е, пробелы схлопнуты
+    """
+    return ' '.join(value.lower().translate(E_FOLDING).split())
+
+
+class Generations:
+    """
+    Поколения списков по индексам. ETL увеличивает поколение индекса
+    в Redis, когда в списках могут появиться другие документы,
+    и присылает новое значение в канале сброса кеша
+    """
+
+    def __init__(self):
+        self.values: dict[str, int] = {}
+
+    def get(self, index: str) -> int:
+        return self.values.get(index, 0)
+
+    def update(self, index: str, generation: Optional[int]):
+        if generation is not None:
+            self.values[index] = generation
+
+
+generations = Generations()
+
+
+async def load_generations(redis_client: Redis, indexes: list[str]):
+    """
+    Текущие поколения индексов из Redis: при старте и после
+    переподключения к каналу, когда сообщения могли потеряться
+    """
+    values = await redis_client.mget(
+        *[f'{settings.CACHE_GENERATION_PREFIX}::{index}' for index in indexes]
+    )
+    for index, value in zip(indexes, values):
+        generations.update(index, int(value) if value else 0)
+
+
 class CacheKey:
     _separator: str = '::'
+    # значения, которые эластика анализирует, а не сравнивает как есть
+    _normalized: tuple = ('query',)
 
     def _create_cache_key(self,
-                          values: list[CacheObj]) -> str:
-        key = f'{self.index}{self._separator}'
+                          values: list[CacheObj],
+                          family: str = 'list') -> str:
+        """
+        Ключ <индекс>::<семейство>::v<CACHE_KEY_VERSION>::<хэш параметров>,
+        у списков и поиска еще и поколение индекса g<N> после версии.
+        Длина ключа не зависит от длины запроса, а запросы,
+        которые эластика не различает, попадают в одну запись
+        """
+        params = ''
         for value in values:
-            key += f'{value.key_name}{self._separator}{value.key_value},'
-
-        return key
+            key_value = value.key_value
+            if value.key_name in self._normalized:
+                key_value = normalize_text(key_value)
+            params += f'{value.key_name}{self._separator}{key_value},'
+        digest = hashlib.blake2b(params.encode(), digest_size=KEY_DIGEST_SIZE).hexdigest()
+        parts = [self.index, family, f'v{settings.CACHE_KEY_VERSION}']
+        if family != 'detail':
+            parts.append(f'g{generations.get(self.index)}')
+        return self._separator.join(parts + [digest])
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from collections import Counter
+
+from aioredis import Redis
+from src.core.config import settings
+
+logger = logging.getLogger('root')
+
+
+class CacheStats:
+    """
+    Счетчики попаданий и промахов кеша по семействам ключей
+    <индекс>:<семейство>. Копятся в воркере и периодически
+    сбрасываются в хэш CACHE_STATS_KEY в Redis
+    """
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+
+    def hit(self, family: str, count: int = 1):
+        if count:
+            self.counts[f'{family}:hit'] += count
+
+    def miss(self, family: str, count: int = 1):
+        if count:
+            self.counts[f'{family}:miss'] += count
+
+    def pop(self) -> Counter:
+        counts, self.counts = self.counts, Counter()
+        return counts
+
+
+cache_stats = CacheStats()
+
+
+async def flush_cache_stats(redis_client: Redis):
+    """
+    Сброс счетчиков воркера в Redis раз в CACHE_STATS_FLUSH_INTERVAL
+    секунд. Несброшенные из-за ошибки счетчики копятся до следующего раза
+    """
+    while True:
+        await asyncio.sleep(settings.CACHE_STATS_FLUSH_INTERVAL)
+        counts = cache_stats.pop()
+        if not counts:
+            continue
+        try:
+            pipeline = redis_client.pipeline()
+            for field, count in counts.items():
+                pipeline.hincrby(settings.CACHE_STATS_KEY, field, count)
+            await pipeline.execute()
+        except asyncio.CancelledError:
+            cache_stats.counts.update(counts)
+            raise
+        except Exception as e:
+            logger.error(f'Cache stats flush failed: {e}')
+            cache_stats.counts.update(counts)
@@ -1,127 +1,153 @@
 import logging
 from functools import lru_cache
 from logging import config as logging_config
-from typing import List, Optional
+from typing import Optional
 
+import orjson
 from fastapi import Depends
+from src.core.config import settings
 from src.core.logger import LOGGING
-from src.db.elastic import AsyncDataProvider, get_elastic
+from src.db.elastic import AsyncDataProvider, InvalidCursorError, get_elastic
 from src.db.redis import AsyncCacheStorage, get_redis
-from src.models.data_models import ElasticFilmWork, Film, ListCache
-from src.services.cache_generate import CacheKey, CacheObj
+from src.models.data_models import ElasticFilmWork, Film
+from src.services.base import BaseService
+from src.services.cache_generate import CacheObj
 
 logging_config.dictConfig(LOGGING)
 logger = logging.getLogger('root')
 logger.debug('Start logging')
 
 
-class FilmService(CacheKey):
-    def __init__(self, redis: AsyncCacheStorage, elastic: AsyncDataProvider):
-        self.redis = redis
-        self.elastic = elastic
-        self.index = 'movies'
+class FilmService(BaseService):
+    index = 'movies'
+    model = Film
+    list_model = ElasticFilmWork
 
-    async def get_film_by_id(self, film_id: str):
+    async def get_film_by_id(self, film_id: str) -> Optional[bytes]:
         """
         Получаем информацию по одному фильму,
          проверяя сначала кеш, потом эластику.
         """
-        film = await self.redis.get(key=film_id)
-        if not film:
-            film_data = await self.elastic.get_by_id(
-                index=self.index,
-                id=film_id)
-            film = Film(**film_data)
-            if not film:
-                return None
-            await self.redis.set(key=film_id,
-                                 value=film.json())
-            return film
-        film_from_cache = Film.parse_raw(film)
-        return film_from_cache
+        return await self._get_by_id(film_id)
+
+    async def get_films_by_ids(self, ids: list[str]) -> bytes:
+        """
+        Получаем несколько фильмов по списку id
+         одним запросом к кешу и одним к эластике.
+        """
+        return await self._get_many(ids)
 
     async def get_all_films(
             self,
             page_size: int,
             page_number: int,
             sort: Optional[str],
-            filter_name: Optional[str],
-            filter_arg: Optional[str]
-    ) -> Optional[List[ElasticFilmWork]]:
+            filters: dict[str, str],
+            cursor: Optional[str] = None
+    ) -> Optional[bytes]:
         """
         Получаем информацию по нескольким фильмам,
          проверяя сначала кеш, потом эластику.
          Также учитываем фильтрацию и сортировку.
         """
 
+        filter_key = self._check_query(filters, sort)
+        source = self._projection(self.list_model)
         key = self._create_cache_key(
             [
-                CacheObj(key_name='filter', key_value=f'{filter_name}_{filter_arg}'),
+                CacheObj(key_name='filter', key_value=filter_key),
                 CacheObj(key_name='sort', key_value=str(sort)),
-                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}')
+                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}'),
+                CacheObj(key_name='fields', key_value=','.join(source))
             ]
         )
-
-        films = await self.redis.get(key=key)
-        if not films:
-            films_response = await self.elastic.get_all(
+        return await self._get_list(
+            key,
+            lambda: self.elastic.get_all(
                 index=self.index,
                 sort=sort,
-                filter_name=filter_name,
-                filter_arg=filter_arg,
+                filters=filters,
                 page_number=page_number,
-                page_size=page_size
-            )
-            films = [ElasticFilmWork(**d) for d in films_response]
-            films_data = ListCache.parse_obj([f.json() for f in films]).json()
-            if not films:
-                return None
-            await self.redis.set(key=key, value=films_data)
-            return films
-        films_data = ListCache.parse_raw(films)
-        film_from_cache = [
-            ElasticFilmWork.parse_raw(film_data) for film_data in films_data.__root__
-        ]
-        return film_from_cache
+                page_size=page_size,
+                cursor=cursor,
+                source=source
+            ),
+            page_size=page_size,
+            page_number=page_number,
+            cursor=cursor
+        )
 
     async def get_search_films(
             self,
             page_size: int,
             page_number: int,
-            query: str
-    ) -> Optional[List[ElasticFilmWork]]:
+            query: str,
+            cursor: Optional[str] = None
+    ) -> Optional[bytes]:
         """
         Поиск по всем фильмам,
              проверяя сначала кеш, потом эластику.
 
         """
 
+        source = self._projection(self.list_model)
         key = self._create_cache_key(
             [
                 CacheObj(key_name='query', key_value=str(query)),
-                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}')
-            ]
+                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}'),
+                CacheObj(key_name='fields', key_value=','.join(source))
+            ],
+            family='search'
         )
-
-        films = await self.redis.get(key=key)
-        if not films:
-            films_response = await self.elastic.search(
+        return await self._get_list(
+            key,
+            lambda: self.elastic.search(
                 index=self.index,
                 query=query,
                 page_number=page_number,
-                page_size=page_size
-            )
-            films = [ElasticFilmWork(**d) for d in films_response]
-            films_data = ListCache.parse_obj([f.json() for f in films]).json()
-            if not films:
-                return None
-            await self.redis.set(key=key, value=films_data)
-            return films
-        films_data = ListCache.parse_raw(films)
-        film_from_cache = [
-            ElasticFilmWork.parse_raw(film_data) for film_data in films_data.__root__
-        ]
-        return film_from_cache
+                page_size=page_size,
+                cursor=cursor,
+                source=source
+            ),
+            page_size=page_size,
+            page_number=page_number,
+            policy='search',
+            cursor=cursor
+        )
+
+    async def get_top_films(
+            self,
+            page_size: int,
+            page_number: int,
+            genre: Optional[str] = None,
+            cursor: Optional[str] = None
+    ) -> Optional[bytes]:
+        """
+        Страница лучших по рейтингу фильмов, общего списка или жанра.
+         Списки ведет ETL в Redis, эластика не участвует.
+         Курсор - позиция следующей страницы в списке.
+        """
+        offset = (page_number - 1) * page_size
+        if cursor:
+            if not cursor.isdigit():
+                raise InvalidCursorError(cursor)
+            offset = int(cursor)
+        key = self._top_key('genre', genre.strip().lower()) if genre else self._top_key('all')
+        docs = await self.redis.get_ranked(key, self._top_key('docs'), offset, offset + page_size - 1)
+        if not docs:
+            return None
+        return self._dump({
+            'page_size': page_size,
+            'page_number': None if cursor else page_number,
+            'next_cursor': str(offset + page_size) if len(docs) == page_size else None,
+            'values': [self.list_model(**orjson.loads(doc)).dict() for doc in docs if doc]
+        })
+
+    def _top_key(self, *parts: str) -> str:
+        """
+        Ключи списков лучших фильмов, формат общий с ETL
+        """
+        return self._separator.join([settings.TOP_KEY_PREFIX, self.index, *parts])
 
 
 @lru_cache()
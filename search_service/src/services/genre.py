@@ -1,14 +1,15 @@
 import logging
 from functools import lru_cache
 from logging import config as logging_config
-from typing import List, Optional
+from typing import Optional
 
 from fastapi import Depends
 from src.core.logger import LOGGING
 from src.db.elastic import AsyncDataProvider, get_elastic
 from src.db.redis import AsyncCacheStorage, get_redis
-from src.models.data_models import Genre, ListCache
-from src.services.cache_generate import CacheKey, CacheObj
+from src.models.data_models import Genre
+from src.services.base import BaseService
+from src.services.cache_generate import CacheObj
 
 FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5
 
@@ -17,114 +18,101 @@ logger = logging.getLogger('root')
 logger.debug('Start logging')
 
 
-class GenreService(CacheKey):
-    def __init__(self, redis: AsyncCacheStorage, elastic: AsyncDataProvider):
-        self.redis = redis
-        self.elastic = elastic
-        self.index = 'genres'
+class GenreService(BaseService):
+    index = 'genres'
+    model = Genre
+    list_model = Genre
 
-    async def get_genre_by_id(self, genre_id: str):
+    async def get_genre_by_id(self, genre_id: str) -> Optional[bytes]:
         """
         Получаем информацию по одному genre,
          проверяя сначала кеш, потом эластику.
         """
-        genre = await self.redis.get(key=genre_id)
-        if not genre:
-            genre_data = await self.elastic.get_by_id(
-                index=self.index,
-                id=genre_id
-            )
-            genre = Genre(**genre_data)
-            if not genre:
-                return None
-            await self.redis.set(key=genre_id,
-                                 value=genre.json())
-            return genre
-        genre_from_cache = Genre.parse_raw(genre)
-        return genre_from_cache
+        return await self._get_by_id(genre_id)
+
+    async def get_genres_by_ids(self, ids: list[str]) -> bytes:
+        """
+        Получаем несколько жанров по списку id
+         одним запросом к кешу и одним к эластике.
+        """
+        return await self._get_many(ids)
 
     async def get_all_genres(
             self,
             page_size: int,
             page_number: int,
             sort: Optional[str],
-            filter_name: Optional[str],
-            filter_arg: Optional[str]
-    ) -> Optional[List[Genre]]:
+            filters: dict[str, str],
+            cursor: Optional[str] = None
+    ) -> Optional[bytes]:
         """
         Получаем информацию по нескольким Genres,
          проверяя сначала кеш, потом эластику.
          Также учитываем фильтрацию и сортировку.
         """
 
+        filter_key = self._check_query(filters, sort)
+        source = self._projection(self.list_model)
         key = self._create_cache_key(
             [
-                CacheObj(key_name='filter', key_value=f'{filter_name}_{filter_arg}'),
+                CacheObj(key_name='filter', key_value=filter_key),
                 CacheObj(key_name='sort', key_value=str(sort)),
-                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}')
+                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}'),
+                CacheObj(key_name='fields', key_value=','.join(source))
             ]
         )
-
-        genres = await self.redis.get(key)
-
-        if not genres:
-            genres_response = await self.elastic.get_all(
+        return await self._get_list(
+            key,
+            lambda: self.elastic.get_all(
                 index=self.index,
                 sort=sort,
-                filter_name=filter_name,
-                filter_arg=filter_arg,
+                filters=filters,
                 page_number=page_number,
-                page_size=page_size
-            )
-            genres = [Genre(**d) for d in genres_response]
-            genres_data = ListCache.parse_obj([f.json() for f in genres]).json()
-            if not genres:
-                return None
-            await self.redis.set(key=key, value=genres_data)
-            return genres
-        genres_data = ListCache.parse_raw(genres)
-        genres_from_cache = [
-            Genre.parse_raw(genre_data) for genre_data in genres_data.__root__
-        ]
-        return genres_from_cache
+                page_size=page_size,
+                cursor=cursor,
+                source=source
+            ),
+            page_size=page_size,
+            page_number=page_number,
+            cursor=cursor
+        )
 
     async def get_search_genres(
             self,
             page_size: int,
             page_number: int,
-            query: str
-    ) -> Optional[List[Genre]]:
+            query: str,
+            cursor: Optional[str] = None
+    ) -> Optional[bytes]:
         """
         Поиск по Genres,
          проверяя сначала кеш, потом эластику.
         """
 
+        source = self._projection(self.list_model)
         key = self._create_cache_key(
             [
                 CacheObj(key_name='query', key_value=str(query)),
-                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}')
-            ]
+                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}'),
+                CacheObj(key_name='fields', key_value=','.join(source))
+            ],
+            family='search'
         )
-        genres = await self.redis.get(key)
-
-        if not genres:
-            genres_response = await self.elastic.search(
+        return await self._get_list(
+            key,
+            lambda: self.elastic.search(
                 index=self.index,
                 query=query,
                 page_number=page_number,
-                page_size=page_size
-            )
-            genres = [Genre(**d) for d in genres_response]
-            genres_data = ListCache.parse_obj([f.json() for f in genres]).json()
-            if not genres:
-                return None
-            await self.redis.set(key=key, value=genres_data)
-            return genres
-        genres_data = ListCache.parse_raw(genres)
-        genres_from_cache = [
-            Genre.parse_raw(genre_data) for genre_data in genres_data.__root__
-        ]
-        return genres_from_cache
+                page_size=page_size,
+                cursor=cursor,
+                source=source
+            ),
+            page_size=page_size,
+            page_number=page_number,
+            policy='search',
+            cursor=cursor
+        )
 
 
 @lru_cache()
@@ -1,14 +1,15 @@
 import logging
 from functools import lru_cache
 from logging import config as logging_config
-from typing import List, Optional
+from typing import Optional
 
 from fastapi import Depends
 from src.core.logger import LOGGING
 from src.db.elastic import AsyncDataProvider, get_elastic
 from src.db.redis import AsyncCacheStorage, get_redis
-from src.models.data_models import ListCache, Person
-from src.services.cache_generate import CacheKey, CacheObj
+from src.models.data_models import Person
+from src.services.base import BaseService
+from src.services.cache_generate import CacheObj
 
 FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5
 
@@ -17,117 +18,100 @@ logger = logging.getLogger('root')
 logger.debug('Start logging')
 
 
-class PersonService(CacheKey):
-    def __init__(self,
-                 redis: AsyncCacheStorage,
-                 elastic: AsyncDataProvider):
-        self.redis = redis
-        self.elastic = elastic
-        self.index = 'persons'
+class PersonService(BaseService):
+    index = 'persons'
+    model = Person
+    list_model = Person
 
-    async def get_person_by_id(self, person_id: str):
+    async def get_person_by_id(self, person_id: str) -> Optional[bytes]:
         """
         Получаем информацию по одному person,
          проверяя сначала кеш, потом эластику.
         """
-        person = await self.redis.get(key=person_id)
+        return await self._get_by_id(person_id)
 
-        if not person:
-            person_data = await self.elastic.get_by_id(
-                index=self.index,
-                id=person_id
-            )
-            person = Person(**person_data)
-            if not person:
-                return None
-            await self.redis.set(key=person_id,
-                                 value=person.json())
-            return person
-        person_from_cache = Person.parse_raw(person)
-        return person_from_cache
+    async def get_persons_by_ids(self, ids: list[str]) -> bytes:
+        """
+        Получаем несколько персон по списку id
+         одним запросом к кешу и одним к эластике.
+        """
+        return await self._get_many(ids)
 
     async def get_all_persons(
             self,
             page_size: int,
             page_number: int,
             sort: Optional[str],
-            filter_name: Optional[str],
-            filter_arg: Optional[str],
-    ) -> Optional[List[Person]]:
+            filters: dict[str, str],
+            cursor: Optional[str] = None
+    ) -> Optional[bytes]:
         """
         Получаем информацию по нескольким Persons,
          проверяя сначала кеш, потом эластику.
          Также учитываем фильтрацию и сортировку.
         """
 
+        filter_key = self._check_query(filters, sort)
+        source = self._projection(self.list_model)
         key = self._create_cache_key(
             [
-                CacheObj(key_name='filter', key_value=f'{filter_name}_{filter_arg}'),
+                CacheObj(key_name='filter', key_value=filter_key),
                 CacheObj(key_name='sort', key_value=str(sort)),
-                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}')
+                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}'),
+                CacheObj(key_name='fields', key_value=','.join(source))
             ]
         )
-
-        persons = await self.redis.get(key)
-
-        if not persons:
-            persons_response = await self.elastic.get_all(
+        return await self._get_list(
+            key,
+            lambda: self.elastic.get_all(
                 index=self.index,
                 sort=sort,
-                filter_name=filter_name,
-                filter_arg=filter_arg,
+                filters=filters,
                 page_number=page_number,
-                page_size=page_size
-            )
-            persons = [Person(**d) for d in persons_response]
-            persons_data = ListCache.parse_obj([f.json() for f in persons]).json()
-            if not persons:
-                return None
-            await self.redis.set(key=key, value=persons_data)
-            return persons
-        persons_data = ListCache.parse_raw(persons)
-        persons_from_cache = [
-            Person.parse_raw(person_data) for person_data in persons_data.__root__
-        ]
-        return persons_from_cache
+                page_size=page_size,
+                cursor=cursor,
+                source=source
+            ),
+            page_size=page_size,
+            page_number=page_number,
+            cursor=cursor
+        )
 
     async def get_search_persons(
             self,
             page_size: int,
             page_number: int,
-            query: str
-    ) -> Optional[List[Person]]:
+            query: str,
+            cursor: Optional[str] = None
+    ) -> Optional[bytes]:
         """
         Поиск по Persons,
          проверяя сначала кеш, потом эластику.
         """
+        source = self._projection(self.list_model)
         key = self._create_cache_key(
             [
                 CacheObj(key_name='query', key_value=str(query)),
-                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}')
-            ]
+                CacheObj(key_name='pagination', key_value=f'{page_size}_{page_number}'),
+                CacheObj(key_name='fields', key_value=','.join(source))
+            ],
+            family='search'
         )
-
-        persons = await self.redis.get(key)
-
-        if not persons:
-            persons_response = await self.elastic.search(
+        return await self._get_list(
+            key,
+            lambda: self.elastic.search(
                 index=self.index,
                 query=query,
                 page_number=page_number,
-                page_size=page_size
-            )
-            persons = [Person(**d) for d in persons_response]
-            persons_data = ListCache.parse_obj([f.json() for f in persons]).json()
-            if not persons:
-                return None
-            await self.redis.set(key=key, value=persons_data)
-            return persons
-        persons_data = ListCache.parse_raw(persons)
-        persons_from_cache = [
-            Person.parse_raw(person_data) for person_data in persons_data.__root__
-        ]
-        return persons_from_cache
+                page_size=page_size,
+                cursor=cursor,
+                source=source
+            ),
+            page_size=page_size,
+            page_number=page_number,
+            policy='search',
+            cursor=cursor
+        )
 
 
 @lru_cache()
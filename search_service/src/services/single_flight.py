@@ -0,0 +1,25 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых запросов внутри воркера: пока запрос
+    по ключу выполняется, остальные ждут его результат,
+    а не выполняют его повторно
+    """
+
+    def __init__(self):
+        self.calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self.calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self.calls[key] = future
+            future.add_done_callback(lambda _: self.calls.pop(key, None))
+        # отмена одного из ожидающих запросов не отменяет общий
+        return await asyncio.shield(future)
+
+
+single_flight = SingleFlight()
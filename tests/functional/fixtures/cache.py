@@ -1,4 +1,5 @@
-import ast
+import gzip
+import json
 
 import pytest
 from aioredis import Redis, create_redis_pool
@@ -21,9 +22,9 @@ def get_from_cache(redis_client: Redis):
     async def inner(key: str):
         data = await redis_client.get(key)
         if data is not None:
-            data = ast.literal_eval(data.decode("utf-8"))
-            if type(data) == list:
-                for i in range(len(data)):
-                    data[i] = ast.literal_eval(data[i])
+            # в кеше лежит готовое тело ответа, возможно сжатое gzip
+            if data.startswith(b'\x1f\x8b'):
+                data = gzip.decompress(data)
+            data = json.loads(data)
         return data
     return inner
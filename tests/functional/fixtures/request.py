@@ -1,4 +1,5 @@
 import json
+from typing import Optional
 
 import aiohttp
 import pytest
@@ -18,4 +19,22 @@ def make_get_request(client_session: aiohttp.ClientSession):
         url = test_settings.service_url + endpoint
         async with client_session.get(url, allow_redirects=False,timeout=1, params=query_data) as response:
             return response.status, await response.json()
-    return inner
\ No newline at end of file
+    return inner
+
+@pytest.fixture
+def make_post_request(client_session: aiohttp.ClientSession):
+    async def inner(endpoint: str, body: dict):
+        url = test_settings.service_url + endpoint
+        async with client_session.post(url, allow_redirects=False, timeout=1, json=body) as response:
+            return response.status, await response.json()
+    return inner
+
+
+@pytest.fixture
+def make_raw_get_request(client_session: aiohttp.ClientSession):
+    async def inner(endpoint: str, query_data: dict, headers: Optional[dict] = None):
+        url = test_settings.service_url + endpoint
+        async with client_session.get(url, allow_redirects=False, timeout=1, params=query_data,
+                                      headers=headers) as response:
+            return response.status, response.headers, await response.read()
+    return inner
@@ -9,5 +9,6 @@ class TestSettings(BaseSettings):
     reids_port: str = Field('6379', env='BROKER_PORT')
     service_url: str = Field('http://127.0.0.1', env='SERVICE_URL')
     cache_separator: str = '::'
+    cache_key_version: int = Field(1, env='CACHE_KEY_VERSION')
 
 test_settings = TestSettings()
\ No newline at end of file
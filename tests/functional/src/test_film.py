@@ -1,9 +1,11 @@
+import json
 from http import HTTPStatus
 
 import pytest
 from tests.functional.testdata.es_mapping import films
 from tests.functional.testdata.validate_mapping import all_film_map, film_map
-from tests.functional.utils.helpers import get_all_cache_key, set_uuid
+from tests.functional.utils.helpers import (get_all_cache_key, normalize_text,
+                                            set_uuid)
 
 
 @pytest.mark.parametrize(
@@ -75,11 +77,16 @@ async def test_films(query_data, expected_answer, es_write_data, make_get_reques
             [
                 {
                     'key_name': 'filter',
-                    'key_value': f'{query_data.get("filter_name", "")}_{query_data.get("filter_arg", "")}'
+                    'key_value': f'{query_data["filter_name"]}={normalize_text(query_data["filter_arg"])}'
+                    if query_data.get('filter_name') else ''
                 },
                 {
                     'key_name': 'sort',
                     'key_value': f'{query_data.get("sort", "")}'
+                },
+                {
+                    'key_name': 'fields',
+                    'key_value': ','.join(all_film_map)
                 }
             ]
         )
@@ -89,7 +96,20 @@ async def test_films(query_data, expected_answer, es_write_data, make_get_reques
         """
         status, body = await make_get_request(f'/api/v1/films/{es_data[0]["id"]}', query_data)
 
-        key = es_data[0]["id"]
+        key = await get_all_cache_key(
+            'movies',
+            [
+                {
+                    'key_name': 'id',
+                    'key_value': es_data[0]["id"]
+                },
+                {
+                    'key_name': 'fields',
+                    'key_value': ','.join(film_map)
+                }
+            ],
+            'detail'
+        )
 
         """
         Валидация конкретного фильма
@@ -113,3 +133,79 @@ async def test_films(query_data, expected_answer, es_write_data, make_get_reques
     """
 
     assert body == await get_from_cache(key)
+
+
+@pytest.mark.asyncio
+async def test_films_mget(es_write_data, make_post_request, get_from_cache):
+    es_data = await set_uuid(films)
+
+    await es_write_data(es_data, 'film')
+
+    ids = [es_data[1]["id"], 'not-found', es_data[0]["id"]]
+    status, body = await make_post_request('/api/v1/films/_mget', {'ids': ids})
+
+    assert status == HTTPStatus.OK
+
+    """
+    Порядок ответа совпадает с порядком id, ненайденные - null
+    """
+    assert [value and value["id"] for value in body["values"]] == [ids[0], None, ids[2]]
+
+    """
+    Найденные фильмы записаны в кеш
+    """
+    key = await get_all_cache_key(
+        'movies',
+        [
+            {
+                'key_name': 'id',
+                'key_value': ids[0]
+            },
+            {
+                'key_name': 'fields',
+                'key_value': ','.join(film_map)
+            }
+        ],
+        'detail'
+    )
+    assert body["values"][0] == await get_from_cache(key)
+
+
+@pytest.mark.asyncio
+async def test_films_top(redis_client, make_get_request):
+    es_data = await set_uuid(films)
+    best, other = dict(es_data[0], imdb_rating=9.0), dict(es_data[1], imdb_rating=7.0)
+
+    """
+    Списки лучших фильмов в том виде, в котором их пишет ETL
+    """
+    await redis_client.delete('top::movies::all', 'top::movies::genre::action', 'top::movies::docs')
+    await redis_client.zadd('top::movies::all', 9.0, best["id"], 7.0, other["id"])
+    await redis_client.zadd('top::movies::genre::action', 7.0, other["id"])
+    await redis_client.hmset_dict('top::movies::docs', {
+        best["id"]: json.dumps(best),
+        other["id"]: json.dumps(other)
+    })
+
+    status, body = await make_get_request('/api/v1/films/top/', {'page[size]': 1})
+
+    assert status == HTTPStatus.OK
+    assert [item["id"] for item in body["values"]] == [best["id"]]
+
+    """
+    Следующая страница по курсору, дальше списка страниц нет
+    """
+    status, body = await make_get_request('/api/v1/films/top/', {'page[size]': 1, 'page[cursor]': body["next_cursor"]})
+
+    assert [item["id"] for item in body["values"]] == [other["id"]]
+
+    status, body = await make_get_request('/api/v1/films/top/', {'page[size]': 1, 'page[cursor]': body["next_cursor"]})
+
+    assert status == HTTPStatus.NOT_FOUND
+
+    """
+    Жанр без учета регистра
+    """
+    status, body = await make_get_request('/api/v1/films/top/', {'genre': 'Action'})
+
+    assert [item["id"] for item in body["values"]] == [other["id"]]
@@ -0,0 +1,126 @@
+from http import HTTPStatus
+
+import pytest
+from tests.functional.testdata.es_mapping import films
+from tests.functional.utils.helpers import set_uuid
+
+
+@pytest.mark.parametrize(
+    'query_data, expected_answer',
+    [
+        # Несколько фильтров сразу: жанр и диапазон рейтинга
+        (
+                {
+                    'filter[genre]': 'Action',
+                    'filter[imdb_rating]': '8..9'
+                },
+                {
+                    'status': HTTPStatus.OK
+                }
+        ),
+        # Полнотекстовый фильтр по актеру
+        (
+                {
+                    'filter[actors_names]': 'johnny'
+                },
+                {
+                    'status': HTTPStatus.OK
+                }
+        ),
+        # Диапазон, в который не попадает ни один фильм
+        (
+                {
+                    'filter[imdb_rating]': '9..'
+                },
+                {
+                    'status': HTTPStatus.NOT_FOUND
+                }
+        )
+    ]
+)
+@pytest.mark.asyncio
+async def test_films_filter(query_data, expected_answer, es_write_data, make_get_request):
+    es_data = await set_uuid(films)
+
+    await es_write_data(es_data, 'film')
+
+    status, body = await make_get_request('/api/v1/films/', query_data)
+
+    assert status == expected_answer["status"]
+
+    """
+    Все фильмы страницы подходят под фильтры
+    """
+    if status == HTTPStatus.OK:
+        for item in body['values']:
+            if 'filter[genre]' in query_data:
+                assert query_data['filter[genre]'] in item['genre']
+            if 'filter[imdb_rating]' in query_data:
+                assert 8 <= item['imdb_rating'] <= 9
+            if 'filter[actors_names]' in query_data:
+                assert 'Johnny' in item['actors_names']
+
+
+@pytest.mark.parametrize(
+    'sort',
+    [
+        'imdb_rating:asc',
+        'imdb_rating:desc',
+        'title'
+    ]
+)
+@pytest.mark.asyncio
+async def test_films_sort(sort, es_write_data, make_get_request):
+    es_data = await set_uuid(films)
+
+    await es_write_data(es_data, 'film')
+
+    status, body = await make_get_request('/api/v1/films/', {'sort': sort, 'page[size]': 10})
+
+    assert status == HTTPStatus.OK
+    assert len(body['values']) == 10
+
+    """
+    Страница упорядочена по полю сортировки
+    """
+    field, _, order = sort.partition(':')
+    values = [item[field] for item in body['values']]
+    assert values == sorted(values, reverse=order != 'asc')
+
+
+@pytest.mark.parametrize(
+    'query_data, detail',
+    [
+        # Поле не из списка фильтров
+        (
+                {'filter[description]': 'New'},
+                'unknown filter description'
+        ),
+        # Фильтр через пару filter_name/filter_arg проверяется так же
+        (
+                {'filter_name': 'foo', 'filter_arg': 'bar'},
+                'unknown filter foo'
+        ),
+        # Некорректный диапазон
+        (
+                {'filter[imdb_rating]': 'a..b'},
+                'invalid range a..b'
+        ),
+        # Поле без doc values
+        (
+                {'sort': 'description'},
+                'unknown sort description'
+        ),
+        # Неизвестное направление сортировки
+        (
+                {'sort': 'imdb_rating:up'},
+                'unknown sort imdb_rating:up'
+        )
+    ]
+)
+@pytest.mark.asyncio
+async def test_films_invalid_query(query_data, detail, make_get_request):
+    status, body = await make_get_request('/api/v1/films/', query_data)
+
+    assert status == HTTPStatus.BAD_REQUEST
+    assert body == {'detail': detail}
@@ -0,0 +1,83 @@
+from http import HTTPStatus
+
+import pytest
+from tests.functional.testdata.es_mapping import films
+from tests.functional.utils.helpers import set_uuid
+
+
+@pytest.mark.parametrize(
+    'endpoint, query_data, max_age',
+    [
+        # Список фильмов
+        (
+                '/api/v1/films/',
+                {},
+                10
+        ),
+        # Поиск фильмов
+        (
+                '/api/v1/films/search/',
+                {'query': 'star'},
+                10
+        )
+    ]
+)
+@pytest.mark.asyncio
+async def test_films_etag(endpoint, query_data, max_age, es_write_data, make_raw_get_request):
+    es_data = await set_uuid(films)
+
+    await es_write_data(es_data, 'film')
+
+    status, headers, body = await make_raw_get_request(endpoint, query_data)
+
+    """
+    Ответ из кеша отдается с ETag и Cache-Control политики
+    """
+    assert status == HTTPStatus.OK
+    assert headers.get('ETag')
+    assert headers['Cache-Control'] == f'public, max-age={max_age}'
+
+    """
+    Тот же ответ у клиента - 304 без тела
+    """
+    status, not_modified_headers, not_modified_body = await make_raw_get_request(
+        endpoint, query_data, {'If-None-Match': headers['ETag']}
+    )
+    assert status == HTTPStatus.NOT_MODIFIED
+    assert not_modified_body == b''
+    assert not_modified_headers['ETag'] == headers['ETag']
+
+    """
+    Слабый ETag, в который nginx превращает сильный, тоже подходит
+    """
+    status, _, _ = await make_raw_get_request(
+        endpoint, query_data, {'If-None-Match': f'W/{headers["ETag"]}'}
+    )
+    assert status == HTTPStatus.NOT_MODIFIED
+
+    """
+    Другой ETag - полный ответ
+    """
+    status, _, other_body = await make_raw_get_request(
+        endpoint, query_data, {'If-None-Match': '"other"'}
+    )
+    assert status == HTTPStatus.OK
+    assert other_body == body
+
+
+@pytest.mark.asyncio
+async def test_film_details_etag(es_write_data, make_raw_get_request):
+    es_data = await set_uuid(films)
+
+    await es_write_data(es_data, 'film')
+
+    endpoint = f'/api/v1/films/{es_data[0]["id"]}'
+    status, headers, _ = await make_raw_get_request(endpoint, {})
+
+    assert status == HTTPStatus.OK
+    assert headers['Cache-Control'] == 'public, max-age=60'
+
+    status, _, body = await make_raw_get_request(endpoint, {}, {'If-None-Match': headers['ETag']})
+
+    assert status == HTTPStatus.NOT_MODIFIED
+    assert body == b''
@@ -0,0 +1,62 @@
+from http import HTTPStatus
+
+import pytest
+from tests.functional.testdata.es_mapping import films
+from tests.functional.utils.helpers import set_uuid
+
+
+@pytest.mark.asyncio
+async def test_films_cursor(es_write_data, make_get_request):
+    es_data = await set_uuid(films)
+
+    await es_write_data(es_data, 'film')
+
+    """
+    Первая страница без курсора отдает курсор следующей
+    """
+    status, body = await make_get_request('/api/v1/films/', {'page[size]': 7})
+
+    assert status == HTTPStatus.OK
+    assert body['page_number'] == 1
+    assert body['next_cursor'] is not None
+
+    """
+    Страницы по курсору идут без повторов и пропусков до последней
+    """
+    seen = [item['id'] for item in body['values']]
+    cursor = body['next_cursor']
+    while cursor is not None:
+        status, body = await make_get_request(
+            '/api/v1/films/',
+            {'page[size]': 7, 'page[cursor]': cursor}
+        )
+        if status == HTTPStatus.NOT_FOUND:
+            # последняя полная страница тоже отдает курсор, за ней пусто
+            break
+        assert status == HTTPStatus.OK
+        assert body['page_number'] is None
+        seen.extend(item['id'] for item in body['values'])
+        cursor = body['next_cursor']
+
+    assert len(seen) == len(set(seen))
+    assert {row['id'] for row in es_data} <= set(seen)
+
+
+@pytest.mark.parametrize(
+    'cursor',
+    [
+        'not-a-cursor',
+        # base64 от {"pit": null}, без значений сортировки
+        'eyJwaXQiOiBudWxsfQ=='
+    ]
+)
+@pytest.mark.asyncio
+async def test_films_invalid_cursor(cursor, es_write_data, make_get_request):
+    es_data = await set_uuid(films)
+
+    await es_write_data(es_data, 'film')
+
+    status, body = await make_get_request('/api/v1/films/', {'page[cursor]': cursor})
+
+    assert status == HTTPStatus.BAD_REQUEST
+    assert body == {'detail': 'invalid page[cursor]'}
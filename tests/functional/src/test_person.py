@@ -55,11 +55,16 @@ async def test_persons(query_data, expected_answer, es_write_data, make_get_requ
             [
                 {
                     'key_name': 'filter',
-                    'key_value': f'{query_data.get("filter_name", "")}_{query_data.get("filter_arg", "")}'
+                    'key_value': f'{query_data["filter_name"]}={query_data["filter_arg"]}'
+                    if query_data.get('filter_name') else ''
                 },
                 {
                     'key_name':'sort',
                     'key_value': f'{query_data.get("sort", "")}'
+                },
+                {
+                    'key_name': 'fields',
+                    'key_value': ','.join(person_map)
                 }
             ]
         )
@@ -69,7 +74,20 @@ async def test_persons(query_data, expected_answer, es_write_data, make_get_requ
         """
         status, body = await make_get_request(f'/api/v1/persons/{es_data[0]["id"]}', query_data)
 
-        key = es_data[0]["id"]
+        key = await get_all_cache_key(
+            'persons',
+            [
+                {
+                    'key_name': 'id',
+                    'key_value': es_data[0]["id"]
+                },
+                {
+                    'key_name': 'fields',
+                    'key_value': ','.join(person_map)
+                }
+            ],
+            'detail'
+        )
 
         """
         Валидация конкретной персоны
@@ -64,8 +64,13 @@ async def test_film_search(query_data, expected_answer, es_write_data, make_get_
             {
                 'key_name': 'query',
                 'key_value': f'{query_data.get("query", "")}'
+            },
+            {
+                'key_name': 'fields',
+                'key_value': ','.join(all_film_map)
             }
-        ]
+        ],
+        'search'
     )
 
     """
@@ -146,8 +151,13 @@ async def test_genre_search(query_data, expected_answer, es_write_data, make_get
             {
                 'key_name': 'query',
                 'key_value': f'{query_data.get("query", "")}'
+            },
+            {
+                'key_name': 'fields',
+                'key_value': ','.join(genre_map)
             }
-        ]
+        ],
+        'search'
     )
 
     """
@@ -227,8 +237,13 @@ async def test_person_search(query_data, expected_answer, es_write_data, make_ge
             {
                 'key_name': 'query',
                 'key_value': f'{query_data.get("query", "")}'
+            },
+            {
+                'key_name': 'fields',
+                'key_value': ','.join(person_map)
             }
-        ]
+        ],
+        'search'
     )
 
     """
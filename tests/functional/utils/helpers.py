@@ -1,3 +1,4 @@
+import hashlib
 import uuid
 
 from tests.functional.settings import test_settings
@@ -11,8 +12,20 @@ async def set_uuid(data: dict) -> dict:
     return es_data
 
 
-async def get_all_cache_key(index: str, values: list) -> str:
-    key = f'{index}{test_settings.cache_separator}'
+def normalize_text(value: str) -> str:
+    return ' '.join(value.lower().translate(str.maketrans({'ё': 'е', 'э': 'е'})).split())
+
+
+async def get_all_cache_key(index: str, values: list, family: str = 'list') -> str:
+    params = ''
     for value in values:
-        key += f'{value["key_name"]}{test_settings.cache_separator}{value["key_value"]},'
-    return key
+        key_value = value["key_value"]
+        if value["key_name"] == 'query':
+            key_value = normalize_text(key_value)
+        params += f'{value["key_name"]}{test_settings.cache_separator}{key_value},'
+    digest = hashlib.blake2b(params.encode(), digest_size=16).hexdigest()
+    parts = [index, family, f'v{test_settings.cache_key_version}']
+    if family != 'detail':
+        # ETL в тестах не запущен, поколение списков нулевое
+        parts.append('g0')
+    return test_settings.cache_separator.join(parts + [digest])